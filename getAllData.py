@@ -1,573 +1,388 @@
-import serial
 import time
 import argparse
-import paho.mqtt.client as mqtt
 import signal
 import sys
-import struct
-
-# Checksum 4bytes, bytes 1-2 0000 not used, bytes 3-4 cumulative total
-def crc(byteData):
-    start_time = time.time()
-    CRC = 0
-    for b in byteData:
-        CRC += b
-    crc_byte4 = CRC & 0xFF
-    crc_byte3 = (CRC >> 8) & 0xFF
-    print(f"CRC calculation took: {time.time() - start_time:.4f} seconds")
-    return [crc_byte3, crc_byte4]
-
-def decode_temperature(temp_raw):
-    if temp_raw <= 100:
-        return temp_raw  # Kladná teplota
-    else:
-        return -(temp_raw - 100)  # Záporná teplota
-
-def getLength(response):
-    print(f"Length of response: {len(response)}")
-    return (len(response))
-
-def parse_temperature_sensor_count(response):
-    try:
-        index_of_86 = response.index(0x86)
-        sensor_count = response[index_of_86 + 1]
-        print(f"Number of temperature sensors: {sensor_count}")
-        return sensor_count
-    except ValueError:
-        print("\033[91m0x86 not found in the response.\033[0m")
-        return None
-
-def parse_temperature_sensors(response):
-    try:
-        index_of_80 = response.index(0x80)
-        power_tube_temp = struct.unpack('>H', response[index_of_80 + 1:index_of_80 + 3])[0]
-        power_tube_temp_c = decode_temperature(power_tube_temp)
-        print(f"Power tube temperature: {power_tube_temp_c} °C")
-
-        index_of_81 = response.index(0x81)
-        battery_box_temp = struct.unpack('>H', response[index_of_81 + 1:index_of_81 + 3])[0]
-        battery_box_temp_c = decode_temperature(battery_box_temp)
-        print(f"Battery box temperature: {battery_box_temp_c} °C")
-
-        index_of_82 = response.index(0x82)
-        battery_temp = struct.unpack('>H', response[index_of_82 + 1:index_of_82 + 3])[0]
-        battery_temp_c = decode_temperature(battery_temp)
-        print(f"Battery temperature: {battery_temp_c} °C")
-
-        return power_tube_temp_c, battery_box_temp_c, battery_temp_c
-    except ValueError:
-        print("Temperature data not found in the response.")
-        return None, None, None
-
-def parse_total_voltage(response):
-    start_time = time.time()
-    try:
-        index_of_83 = response.index(0x83)
-        if args.ptime == "show":
-            print(f"Found 0x83 at position: {index_of_83}")
-        
-        # Využití struct pro přečtení 2 bajtů jako unsigned short (16 bitů) big-endian
-        total_voltage_raw = struct.unpack_from('>H', response, index_of_83 + 1)[0]
-        total_voltage = total_voltage_raw * 0.01
-        
-        print(f"Total voltage (V): {total_voltage}")
-        if args.ptime == "show":
-         print(f"Total voltage parsing took: {time.time() - start_time:.4f} seconds")
-        return total_voltage
-    except ValueError:
-        print("\033[91m0x83 not found in the response.\033[0m")
-        return None
-
-def parse_soc(response):
-    start_time = time.time()
-    try:
-        index_of_85 = response.index(0x85)
-        if args.ptime == "show":
-            print(f"Found 0x85 at position: {index_of_85}")
-        soc_value = response[index_of_85 + 1]
-        print(f"SOC (State of Charge): {soc_value}%")
-        if args.ptime == "show":
-         print(f"SOC parsing took: {time.time() - start_time:.4f} seconds")
-        return soc_value
-    except ValueError:
-        print("\033[91m0x85 not found in the response.\033[0m")
-        return None
-
-def parse_current(response):
-    start_time = time.time()
-    try:
-        index_of_84 = response.index(0x84)
-        if args.ptime == "show":
-            print(f"Found 0x84 at position: {index_of_84}")
-        current_high = response[index_of_84 + 1]
-        current_low = response[index_of_84 + 2]
-        current_raw = (current_high << 8) | current_low
-
-        print(f"Current high byte: {current_high} (hex: {hex(current_high)})")
-        print(f"Current low byte: {current_low} (hex: {hex(current_low)})")
-        print(f"Raw current data: {current_raw} (hex: {hex(current_raw)})")
-
-        if current_raw <= 10000:
-            current = ((10000 - current_raw) * 0.01) - 100
-            print(f"Current (discharging): {current} A")
-            return current
-        elif current_raw >= 32768:
-            current = (current_raw - 32768 - 10000) * 0.01
-            if current_raw > 32768:
-                current = (current_raw - 32768) * 0.01
-            print(f"Current (charging): {current} A")
-            return current
-        else:
-            print("Current data outside expected range")
-            return None
-    except ValueError:
-        print("\033[91m0x84 not found in the response.\033[0m")
-        return None
-    finally:
-        if args.ptime == "show":
-         print(f"Current parsing took: {time.time() - start_time:.4f} seconds")
-
-def parse_total_battery_strings(response):
-    start_time = time.time()
-    try:
-        index_of_8a = response.index(0x8a)
-        if args.ptime == "show":
-            print(f"Found 0x8A at position: {index_of_8a}")
-        strings_high = response[index_of_8a + 1]
-        strings_low = response[index_of_8a + 2]
-        total_strings = (strings_high << 8) | strings_low
-        print(f"Total number of battery strings: {total_strings}")
-        if args.ptime == "show":
-         print(f"Battery strings parsing took: {time.time() - start_time:.4f} seconds")
-        return total_strings
-    except ValueError:
-        print("\033[91m0x8A not found in the response.\033[0m")
-        return None
-
-def parse_individual_cell_voltage(response):
-    start_time = time.time()
-    try:
-        index_of_79 = response.index(0x79)
-        if args.ptime == "show":
-            print(f"Found 0x79 at position: {index_of_79}")
-        length_of_data = response[index_of_79 + 1]
-        cell_voltages = []
-        for i in range(0, length_of_data, 3):
-            cell_number = response[index_of_79 + 2 + i]
-            voltage_high = response[index_of_79 + 2 + i + 1]
-            voltage_low = response[index_of_79 + 2 + i + 2]
-            voltage_mv = (voltage_high << 8) | voltage_low
-            voltage_v = voltage_mv / 1000.0
-            cell_voltages.append((cell_number, voltage_v))
-            print(f"Cell {cell_number} voltage: {voltage_v} V")
-        if args.ptime == "show":
-         print(f"Cell voltage parsing took: {time.time() - start_time:.4f} seconds")
-        return cell_voltages
-    except ValueError:
-        print("\033[91m0x79 not found in the response.\033[0m")
-        return None
-
+import logging
+
+from jkbms_decode import IncrementalDecoder, scale_fields
+from jkbms_sample import BmsSample
+from jkbms_serial import BmsSerialSession
+from jkbms_bus import BmsBus
+from jkbms_fleet import BmsFleet
+from jkbms_frames import BROADCAST_BMS_ID, FrameLibrary
+from jkbms_tiered import TieredPoller, default_tiers
+from jkbms_schedule import FixedRateScheduler
+from jkbms_binary import encode_sample
+from jkbms_lineproto import LineProtocolSerializer
+from jkbms_spool import DiskSpool, SpoolDrainer
+from jkbms_journal import FrameJournal
+from jkbms_deadband import DeadbandFilter, parse_deadband, parse_deadbands
+from jkbms_queue import BACKPRESSURE_POLICIES, SinkQueue
+from jkbms_mqtt import DEFAULT_BROKER, DEFAULT_PORT, DEFAULT_TOPIC, LineBatcher, MqttPublisher
+from jkbms_log import LOG_LEVELS, get_logger, setup_logging
+
+serial_log = get_logger("serial")
+decode_log = get_logger("decode")
+mqtt_log = get_logger("mqtt")
+timing_log = get_logger("timing")
+daemon_log = get_logger("daemon")
+bus_log = get_logger("bus")
+
+# cell_voltages je array('H') v mV, článek i je na indexu i - 1
 def calculate_delta_voltage(cell_voltages):
     if not cell_voltages:
-        print("No cell voltage data available.")
+        decode_log.warning("No cell voltage data available.")
         return None
 
-    min_cell = min(cell_voltages, key=lambda x: x[1])
-    max_cell = max(cell_voltages, key=lambda x: x[1])
-    delta_voltage = max_cell[1] - min_cell[1]
-    print(f"Delta voltage: {delta_voltage:.3f} V (Max: Cell {max_cell[0]} - {max_cell[1]:.3f} V, Min: Cell {min_cell[0]} - {min_cell[1]:.3f} V)")
+    min_mv = min(cell_voltages)
+    max_mv = max(cell_voltages)
+    delta_voltage = (max_mv - min_mv) / 1000.0
+    decode_log.debug("Delta voltage: %.3f V (Max: Cell %s - %.3f V, Min: Cell %s - %.3f V)", delta_voltage, cell_voltages.index(max_mv) + 1, max_mv / 1000.0, cell_voltages.index(min_mv) + 1, min_mv / 1000.0)
     return delta_voltage
 
-def parse_software_version(response):
-    start_time = time.time()
-    try:
-        index_of_b7 = response.index(0xb7)
-        if args.ptime == "show":
-            print(f"Found 0xB7 at position: {index_of_b7}")
-        version_data = response[index_of_b7 + 1:index_of_b7 + 16].decode("utf-8")
-        print(f"Software version number: {version_data}")
-        if args.ptime == "show":
-         print(f"Software version parsing took: {time.time() - start_time:.4f} seconds")
-        return version_data
-    except ValueError:
-        print("\033[91m0xB7 not found in the response.\033[0m")
-        return None
-
-def parse_actual_battery_capacity(response):
-    start_time = time.time()
-    try:
-        index_of_b9 = response.index(0xb9)
-        if args.ptime == "show":
-            print(f"Found 0xB9 at position: {index_of_b9}")
-        capacity_high = response[index_of_b9 + 1]
-        capacity_low = response[index_of_b9 + 2]
-        actual_capacity = (capacity_high << 8) | capacity_low
-        print(f"Actual battery capacity: {actual_capacity} AH")
-        if args.ptime == "show":
-         print(f"Actual battery capacity parsing took: {time.time() - start_time:.4f} seconds")
-        return actual_capacity
-    except ValueError:
-        print("\033[91m0xB9 not found in the response.\033[0m")
-        return None
-
-def parse_protocol_version(response):
-    start_time = time.time()
-    try:
-        index_of_c0 = response.index(0xc0)
-        if args.ptime == "show":
-            print(f"Found 0xC0 at position: {index_of_c0}")
-        protocol_version = response[index_of_c0 + 1]
-        print(f"Protocol version number: {protocol_version}")
-        if args.ptime == "show":
-         print(f"Protocol version parsing took: {time.time() - start_time:.4f} seconds")
-        return protocol_version
-    except ValueError:
-        print("\033[91m0xC0 not found in the response.\033[0m")
-        return None
-    
-def parse_battery_capacity_setting(response):
-    start_time = time.time()
-    try:
-        index_of_aa = response.index(0xaa)
-        if args.ptime == "show":
-            print(f"Found 0xAA at position: {index_of_aa}")
-        
-        # Načteme 4 bajty pro kapacitu
-        capacity_bytes = response[index_of_aa + 1:index_of_aa + 5]
-        
-        # Převod 4 bajtů na integer (kapacita baterie v AH)
-        battery_capacity = struct.unpack('>I', capacity_bytes)[0]
-        
-        print(f"Battery capacity setting: {battery_capacity} AH")
-        print(f"Battery capacity parsing took: {time.time() - start_time:.4f} seconds")
-        return battery_capacity
-    except ValueError:
-        print("\033[91m0xAA not found in the response.\033[0m")
-        return None
-
-def parse_battery_cycle_count(response):
-    start_time = time.time()
-    try:
-        index_of_87 = response.index(0x87)
-        if args.ptime == "show": 
-            print(f"Found 0x87 at position: {index_of_87}")
-        
-        # Načteme 2 bajty pro počet cyklů baterie
-        cycle_count_bytes = response[index_of_87 + 1:index_of_87 + 3]
-        
-        # Převod 2 bajtů na integer (počet cyklů baterie)
-        cycle_count = struct.unpack('>H', cycle_count_bytes)[0]
-       
-        print(f"Number of battery cycles: {cycle_count}")
-        if args.ptime == "show":
-         print(f"Battery cycle count parsing took: {time.time() - start_time:.4f} seconds")
-        return cycle_count
-    except ValueError:
-        print("\033[91m0x87 not found in the response.\033[0m")
-        return None
-
-def parse_battery_status(response):
-    start_time = time.time()
-    try:
-        index_of_8c = response.index(0x8c)
-        if args.ptime == "show":
-            print(f"Found 0x8C at position: {index_of_8c}")
-        
-        # Načtení 2 bajtů stavu baterie
-        status_high = response[index_of_8c + 1]
-        status_low = response[index_of_8c + 2]
-        status_raw = (status_high << 8) | status_low
-        
-        print(f"Battery status raw data: {status_raw} (hex: {hex(status_raw)})")
-
-        # Dekódování jednotlivých bitů
-        charging_mos = (status_raw >> 0) & 1
-        discharging_mos = (status_raw >> 1) & 1
-        balance_switch = (status_raw >> 2) & 1
-        battery_dropped = (status_raw >> 3) & 1
-
-        # Výpis výsledků
-        print(f"Charging MOS tube state: {'On' if charging_mos else 'Off'}")
-        print(f"Discharging MOS tube state: {'On' if discharging_mos else 'Off'}")
-        print(f"Balance switch state: {'On' if balance_switch else 'Off'}")
-        print(f"Battery dropped: {'Normal' if battery_dropped else 'Offline'}")
-        
-        if args.ptime == "show":
-            print(f"Battery status parsing took: {time.time() - start_time:.4f} seconds")
-        
-        return {
-            'charging_mos': charging_mos,
-            'discharging_mos': discharging_mos,
-            'balance_switch': balance_switch,
-            'battery_dropped': battery_dropped
-        }
-    except ValueError:
-        print("\033[91m0x8C not found in the response.\033[0m")
-        return None
-
-def parse_total_battery_cycle_capacity(response):
-    start_time = time.time()
-    try:
-        index_of_89 = response.index(0x89)
-        if args.ptime == "show":
-         print(f"Found 0x89 at position: {index_of_89}")
-        
-        # Načteme 4 bajty pro celkovou cyklickou kapacitu
-        cycle_capacity_bytes = response[index_of_89 + 1:index_of_89 + 5]
-        
-        # Převod 4 bajtů na integer (cyklická kapacita baterie)
-        cycle_capacity = struct.unpack('>I', cycle_capacity_bytes)[0]
-        
-        print(f"Total battery cycle capacity: {cycle_capacity} AH")
-        if args.ptime == "show":
-            print(f"Battery cycle capacity parsing took: {time.time() - start_time:.4f} seconds")
-        return cycle_capacity
-    except ValueError:
-        print("\033[91m0x89 not found in the response.\033[0m")
-        return None
-
-def parse_current_calibration(response):
-    start_time = time.time()
-    try:
-        index_of_ad = response.index(0xad)
-        if args.ptime == "show":
-            print(f"Found 0xAD at position: {index_of_ad}")
-        calibration_high = response[index_of_ad + 1]
-        calibration_low = response[index_of_ad + 2]
-        calibration_value = (calibration_high << 8) | calibration_low
-        print(f"Current calibration: {calibration_value} mA")
-        if args.ptime == "show":
-         print(f"Current calibration parsing took: {time.time() - start_time:.4f} seconds")
-        return calibration_value
-    except ValueError:
-        print("\033[91m0xAD not found in the response.\033[0m")
-        return None
-
-def parse_current_calibration_status(response):
-    start_time = time.time()
-    try:
-        # Najdeme index 0xB8 v odpovědi
-        index_of_b8 = response.index(0xb8)
-        if args.ptime == "show":
-            print(f"Found 0xB8 at position: {index_of_b8}")
-
-        # Čteme 1 bajt, který udává stav kalibrace
-        calibration_status = response[index_of_b8 + 1]
-
-        # Vyhodnotíme stav kalibrace
-        if calibration_status == 1:
-            print(f"Current calibration: STARTED")
-        elif calibration_status == 0:
-            print(f"Current calibration: STOPPED")
-        else:
-            print(f"Unknown calibration status: {calibration_status}")
-        if args.ptime == "show":
-         print(f"Current calibration status parsing took: {time.time() - start_time:.4f} seconds")
-        return calibration_status
-    except ValueError:
-        print("\033[91m0xB8 not found in the response.\033[0m")  # Červeně pro chybovou zprávu
-        return None
-
-def parse_active_balance_switch(response):
-    start_time = time.time()
-    try:
-        index_of_9d = response.index(0x9d)
-        if args.ptime == "show":
-         print(f"Found 0x9D at position: {index_of_9d}")
-        active_balance_switch = response[index_of_9d + 1]
-        print(f"Active balance switch: {'ON' if active_balance_switch == 1 else 'OFF'}")
-        if args.ptime == "show":
-         print(f"Active balance switch parsing took: {time.time() - start_time:.4f} seconds")
-        return active_balance_switch
-    except ValueError:
-        print("\033[91m0x9D not found in the response.\033[0m")
-        return None
-
-
-
-def parse_battery_warning(response):
-    try:
-        index_of_8b = response.index(0x8B)
-        if args.ptime == "show":
-            print(f"Found 0x8B at position: {index_of_8b}")
-        warning_high = response[index_of_8b + 1]
-        warning_low = response[index_of_8b + 2]
-        warning_raw = (warning_high << 8) | warning_low
-
-        print(f"Battery warning raw data: {warning_raw} (hex: {hex(warning_raw)})")
-
-        # Dekódování jednotlivých bitů
-        warning_messages = {
-            0: "Low capacity alarm",
-            1: "MOS tube overtemperature alarm",
-            2: "Charging overvoltage alarm",
-            3: "Discharge undervoltage alarm",
-            4: "Battery over temperature alarm",
-            5: "Charging overcurrent alarm",
-            6: "Discharge overcurrent alarm",
-            7: "Cell differential pressure alarm",
-            8: "Overtemperature alarm in battery box",
-            9: "Battery low temperature alarm",
-            10: "Monomer overvoltage alarm",
-            11: "Monomer undervoltage alarm",
-            12: "309_A protection alarm",
-            13: "309_B protection alarm",
-            14: "Reserved",
-            15: "Reserved"
-        }
-
-        for bit, message in warning_messages.items():
-            if warning_raw & (1 << bit):
-                print(f"Warning: {message}")
-            else:
-                print(f"Normal: {message}")
-
-        return warning_raw
-    except ValueError:
-        print("\033[91m0x8B not found in the response.\033[0m")
-        return None
-
 
-def send_data_to_mqtt(voltage, current, delta_voltage, cell_voltages, soc, power_tube_temp, battery_box_temp, battery_temp,response_length):
-    mqtt_broker = "127.0.0.1"
-    mqtt_port = 1883
-    mqtt_topic = "jkbms-test"
-
-    client = mqtt.Client()
-    client.connect(mqtt_broker, mqtt_port, 60)
-
-    # Rozbalíme jednotlivé napětí článků pro odeslání
-    cell_voltage_data = ",".join([f"voltage_cell{cell[0]}={cell[1]}" for cell in cell_voltages])
-
-    # Přidáme SOC, teploty a napětí článků do zprávy
-    data = (f"battery_measurements voltage={voltage},current={current},delta_voltage={delta_voltage},soc={soc},"
-            f"power_tube_temp={power_tube_temp},battery_box_temp={battery_box_temp},battery_temp={battery_temp},"
-            f"{cell_voltage_data},response_length={response_length}")
-    
-    client.publish(mqtt_topic, data)
-    print(f"Data o napětí {voltage} V, proudu {current} A, delta napětí {delta_voltage} V, SOC {soc}%, "
-          f"teplotě MOSFETu {power_tube_temp} °C, teplotě bateriového boxu {battery_box_temp} °C, "
-          f"teplotě baterie {battery_temp} °C a napětí článků byla odeslána na MQTT téma '{mqtt_topic}'.")
+# Odeslání přes jedno trvalé spojení (mqtt_publisher), bez connect/disconnect na každý vzorek
+# S dávkováním (mqtt_batcher) jde víc vzorků v jedné zprávě, každý se svým časem;
+# nově vzniklý alarm (nový bit varování proti minulému vzorku téže BMS) dávku odešle hned
+# S deadband_filter jdou jen pole, která se posunula o víc než své pásmo, a periodicky celý keyframe
+def send_data_to_mqtt(sample):
+    pack = (sample.port, sample.bms_id)
+    new_alarm = sample.battery_warning & ~last_warnings.get(pack, 0)
+    last_warnings[pack] = sample.battery_warning
+    fields = None
+    if deadband_filter is not None:
+        fields, _ = deadband_filter.filter(pack, sample.raw_fields())
+        if not fields:
+            if new_alarm and mqtt_batcher is not None:
+                mqtt_batcher.flush()
+            return
+    if args.format == "binary":
+        # Binární záznam nese vždy všechna pole i timestamp, deadband jen rozhoduje zda odeslat
+        payload = encode_sample(sample)
+    else:
+        payload = line_serializer.serialize(sample) if fields is None else line_serializer.serialize_fields(sample, fields)
+    if mqtt_batcher is not None:
+        mqtt_batcher.add(payload, urgent=bool(new_alarm))
+    else:
+        publish_payload(payload)
+    mqtt_log.debug("Data o napětí %s V, proudu %s A, delta napětí %s V, SOC %s%%, "
+                   "teplotě MOSFETu %s °C, teplotě bateriového boxu %s °C, "
+                   "teplotě baterie %s °C a napětí článků byla odeslána na MQTT téma '%s'.",
+                   sample.voltage, sample.current, sample.delta_voltage, sample.soc,
+                   sample.power_tube_temp, sample.battery_box_temp, sample.battery_temp, mqtt_publisher.topic)
 
-    client.disconnect()
 
 
 
 
+# Bez spojení s brokerem jde zpráva do diskového spoolu, po připojení ji odešle mqtt_drainer
+def publish_payload(payload):
+    if mqtt_spool is None:
+        mqtt_publisher.publish(payload)
+    elif not mqtt_publisher.try_publish(payload):
+        mqtt_spool.append(payload)
 
 # Přidáme funkci pro zachycení signálu ukončení (Ctrl+C)
 def signal_handler(sig, frame):
-    print("Exiting daemon...")
+    daemon_log.info("Exiting daemon...")
+    if fleet is not None:
+        fleet.stop()
+        log_fleet_stats()
+    log_bus_stats()
+    log_schedule_stats()
+    log_tiered_stats()
+    bms_session.close()
+    close_journal()
+    close_mqtt()
     sys.exit(0)
 
-# Hlavní funkce pro interpretaci všech dat
+def close_journal():
+    if frame_journal is not None:
+        frame_journal.close()
+        daemon_log.info("Journal: %d frames recorded in %s", frame_journal.frames, args.journal)
+
+def log_bus_stats():
+    stats = bms_session.parser.stats()
+    if stats["corrupt"] or stats["truncated"] or stats["resyncs"] or stats["echoes"]:
+        serial_log.info("Frames: %d valid, %d corrupt, %d truncated, %d resyncs (%d bytes discarded), %d echoes skipped",
+                        stats["frames"], stats["corrupt"], stats["truncated"], stats["resyncs"],
+                        stats["discarded_bytes"], stats["echoes"])
+    if bms_bus is not None:
+        stats = bms_bus.stats()
+        bus_log.info("Bus: %d polls, %d timeouts, %d ID mismatches, %.1f polls/s, "
+                     "wire utilization %.1f %%, max %.1f polls/s",
+                     stats["polls"], stats["timeouts"], stats["id_mismatches"], stats["poll_rate"],
+                     stats["wire_utilization"] * 100, stats["max_poll_rate"])
+
+def log_schedule_stats():
+    if scheduler is not None and scheduler.cycles:
+        stats = scheduler.stats()
+        daemon_log.info("Schedule: %d cycles, %.2f Hz achieved of %.2f Hz, jitter mean %.1f ms max %.1f ms, "
+                        "%d overruns, %d skipped slots",
+                        stats["cycles"], stats["achieved_rate"], args.rate, stats["jitter_mean"] * 1000,
+                        stats["jitter_max"] * 1000, stats["overruns"], stats["skipped"])
+
+def log_tiered_stats():
+    if tiered_poller is not None and tiered_poller.rounds:
+        stats = tiered_poller.stats()
+        daemon_log.info("Tiered: %d rounds, %.0f bytes/s on the wire (%.1f %% of the line), %.1fx fewer bytes "
+                        "than full dumps at the same rate, %d timeouts",
+                        stats["rounds"], stats["bytes_per_second"], stats["wire_utilization"] * 100,
+                        stats["wire_saving"], stats["timeouts"])
+
+# Po portech flotily: plánovač (overruny, jitter) a čítače parseru
+def log_fleet_stats():
+    for fleet_port, stats in fleet.stats().items():
+        daemon_log.info("%s: %d samples, %d cycles, %.2f Hz achieved, jitter max %.1f ms, %d overruns, "
+                        "%d skipped slots; frames %d valid, %d corrupt, %d truncated, %d resyncs, %d echoes",
+                        fleet_port, stats["samples"], stats["cycles"], stats["achieved_rate"],
+                        stats["jitter_max"] * 1000, stats["overruns"], stats["skipped"], stats["frames"],
+                        stats["corrupt"], stats["truncated"], stats["resyncs"], stats["echoes"])
+
+def close_mqtt():
+    if publish_queue is not None:
+        publish_queue.stop()
+        stats = publish_queue.stats()
+        mqtt_log.info("Publish queue: %d processed, max depth %d, %d dropped (oldest %d, newest %d), %d errors",
+                      stats["processed"], stats["max_depth"], stats["dropped_oldest"] + stats["dropped_newest"],
+                      stats["dropped_oldest"], stats["dropped_newest"], stats["errors"])
+    if deadband_filter is not None:
+        stats = deadband_filter.stats()
+        mqtt_log.info("Deadband: %d of %d fields sent (%.1f %% saved), %d keyframes",
+                      stats["fields_out"], stats["fields_in"], stats["reduction"] * 100, stats["keyframes"])
+    if mqtt_batcher is not None:
+        mqtt_batcher.flush()
+        stats = mqtt_batcher.stats()
+        mqtt_log.info("MQTT batches: %d messages, %.1f samples per message", stats["batches"], stats["lines_per_batch"])
+    if mqtt_drainer is not None:
+        mqtt_drainer.stop()
+        mqtt_spool.close()
+        stats = mqtt_spool.stats()
+        mqtt_log.info("Spool: %d records spooled, %d drained, %d bytes pending, %d bytes dropped",
+                      stats["appended"], stats["drained"], stats["pending_bytes"], stats["dropped_bytes"])
+    if mqtt_publisher is not None:
+        stats = mqtt_publisher.stats()
+        mqtt_log.info("MQTT: %d published, %d failed, %d disconnects",
+                      stats["published"], stats["failed"], stats["disconnects"])
+        mqtt_publisher.close()
+
+# Výpis a odeslání jednoho vzorku, společné pro jeden port i flotilu
+def process_sample(sample):
+    if decode_log.isEnabledFor(logging.DEBUG):
+        for cell_number, voltage_mv in enumerate(sample.cells, 1):
+            decode_log.debug("Cell %s voltage: %s V", cell_number, voltage_mv / 1000.0)
+        calculate_delta_voltage(sample.cells)
+
+    # Odeslání běží ve vlákně fronty, dotazování na výstup nikdy nečeká
+    if publish_queue is not None:
+        publish_queue.put(sample)
+
+# Jedno kolo dotazů: jedna BMS, nebo všechny BMS na sdílené sběrnici
 def gather_and_send_data():
-    with serial.serial_for_url(port, baud) as s:
-        s.timeout = 0.5
-        s.write_timeout = 0.5
-        s.flushInput()
-        s.flushOutput()
-
-        read_start_time = time.time()
-        print(f"sending command: {request_FRAME.hex()}")
-        bytes_written = s.write(request_FRAME)
-        print(f"wrote {bytes_written} bytes")
-
-        full_response = s.read(255)
-        read_time = time.time() - read_start_time
-        print(f"Full response: {full_response.hex()}")
-        print(f"Response read took: {read_time:.4f} seconds")
-
-        interpret_start_time = time.time()
-
-        if len(full_response) > 38:
-            total_voltage = parse_total_voltage(full_response)
-            soc_value = parse_soc(full_response)
-            current_value = parse_current(full_response)
-            total_strings = parse_total_battery_strings(full_response)
-            cell_voltages = parse_individual_cell_voltage(full_response)
-            delta_voltage = calculate_delta_voltage(cell_voltages)
-
-            # Nové funkce pro čtení dalších dat
-            software_version = parse_software_version(full_response)
-            actual_battery_capacity = parse_actual_battery_capacity(full_response)
-            protocol_version = parse_protocol_version(full_response)
-            current_calibration = parse_current_calibration(full_response)
-            current_calibration_status=parse_current_calibration_status(full_response)
-            active_balance_switch = parse_active_balance_switch(full_response)
-            battery_warn = parse_battery_warning(full_response)
-            power_tube_temp, battery_box_temp, battery_temp = parse_temperature_sensors(full_response)
-            temp_sensor_count=parse_temperature_sensor_count(full_response)
-            battery_capacity = parse_battery_capacity_setting(full_response)
-            battery_cycle_capacity = parse_total_battery_cycle_capacity(full_response)
-            battery_cycle_count = parse_battery_cycle_count(full_response)
-            battery_status = parse_battery_status(full_response)
-            response_length=getLength(full_response)
-
-            if args.output == "mqtt":
-                send_data_to_mqtt(total_voltage, current_value, delta_voltage, cell_voltages, soc_value,
-                                  power_tube_temp, battery_box_temp, battery_temp,response_length)
-
-        interpret_time = time.time() - interpret_start_time
-        print(f"Data interpretation took: {interpret_time:.4f} seconds")
+    if bms_bus is None:
+        poll_and_send_data(None)
+    else:
+        for _ in range(bms_bus.round_length):
+            poll_and_send_data(bms_bus.next_unit())
+
+# Hlavní funkce pro interpretaci všech dat
+def poll_and_send_data(bms_id):
+    read_start_time = time.time()
+    if bms_id is None:
+        full_response = bms_session.transact(request_frames.read_all())
+    else:
+        full_response = bms_bus.poll_unit(bms_id)
+    if full_response is None:
+        return
+    # Časová značka vzorku = přijetí rámce, z monotónních hodin (nezávislá na zpoždění MQTT),
+    # stejná značka jde i do deníku surových rámců
+    received_at = bms_session.received_ns
+    read_time = time.time() - read_start_time
+    timing_log.debug("Response read took: %.4f seconds", read_time)
+
+    interpret_start_time = time.time()
+
+    if len(full_response) > 38:
+        # Jeden průchod rámcem, znovu se dekódují jen změněné registry
+        fields, changed = frame_decoders[bms_id].decode(full_response)
+        sample = BmsSample.from_fields(fields, len(full_response), received_at, changed)
+        if bms_id is not None:
+            sample.bms_id = bms_id.hex()
+        if decode_log.isEnabledFor(logging.DEBUG):
+            for name, value in scale_fields({name: value for name, value in fields.items() if name in changed}).items():
+                if name != "cell_voltages":
+                    decode_log.debug("%s: %s", name, value)
+        process_sample(sample)
+
+    interpret_time = time.time() - interpret_start_time
+    timing_log.debug("Data interpretation took: %.4f seconds", interpret_time)
+
+# Typ argumentu: celé číslo alespoň 1
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def deadband_item(text):
+    try:
+        return parse_deadband(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
 
 # Parsing command-line arguments
 parser = argparse.ArgumentParser(description="Monitor BMS data and optionally send it via MQTT.")
 parser.add_argument("-o", "--output", choices=["mqtt", "none"], default="none", help="Send output to MQTT")
+parser.add_argument("--mqtt-host", default=DEFAULT_BROKER, help=f"MQTT broker (default {DEFAULT_BROKER})")
+parser.add_argument("--mqtt-port", type=int, default=DEFAULT_PORT, help=f"MQTT port (default {DEFAULT_PORT})")
+parser.add_argument("--mqtt-topic", default=DEFAULT_TOPIC, help=f"MQTT topic (default {DEFAULT_TOPIC})")
+parser.add_argument("--mqtt-qos", type=int, choices=[0, 1, 2], default=0, help="MQTT QoS (default 0)")
+parser.add_argument("--mqtt-retain", action="store_true", help="Publish with the retain flag")
+parser.add_argument("--format", choices=["line", "binary"], default="line",
+                    help="MQTT payload: Influx line protocol or compact binary records (jkbms_binary)")
+parser.add_argument("--batch", type=int, default=1, metavar="N",
+                    help="Send up to N samples (with timestamps) in one MQTT message (default 1 = no batching)")
+parser.add_argument("--batch-ms", type=int, default=1000, metavar="T",
+                    help="Send a partial batch after T ms (default 1000); samples with an alarm are sent at once")
+parser.add_argument("--deadband", action="store_true",
+                    help="Publish only fields that moved past their deadband (2 mV per cell, 0.05 A, any SOC change)")
+parser.add_argument("--deadband-set", action="append", type=deadband_item, default=None, metavar="FIELD=VALUE",
+                    help="Override a deadband in V/A/%%/°C, e.g. current=0.1 or voltage_cell=0.003 (implies --deadband)")
+parser.add_argument("--keyframe", type=float, default=60.0, metavar="SECONDS",
+                    help="With --deadband: publish all fields every SECONDS (default 60)")
+parser.add_argument("--spool", default=None, metavar="DIR",
+                    help="Store MQTT messages in DIR while the broker is unreachable and send them afterwards")
+parser.add_argument("--spool-max-mb", type=float, default=64, help="Spool size limit, oldest data dropped (default 64)")
+parser.add_argument("--spool-drain", type=int, default=100, metavar="N",
+                    help="Spooled messages sent per drain step, one step every 0.5 s (default 100)")
+parser.add_argument("--journal", default=None, metavar="DIR",
+                    help="Record every raw BMS response with its receive time in DIR (replay with jkbms_journal.py)")
+parser.add_argument("--queue-size", type=positive_int, default=1000,
+                    help="Samples buffered between polling and MQTT output (default 1000)")
+parser.add_argument("--backpressure", choices=list(BACKPRESSURE_POLICIES), default="drop-oldest",
+                    help="When the output queue is full: drop the oldest or newest sample, or block polling")
 parser.add_argument("-d", "--daemon", action="store_true", help="Run script as daemon")
 parser.add_argument("-t", "--ptime", choices=["show", "none"], default="none", help="Print time")
+parser.add_argument("-l", "--log-level", choices=list(LOG_LEVELS), default=None,
+                    help="Log level (default: debug for a single run, info in daemon mode)")
+parser.add_argument("-p", "--port", action="append", default=None,
+                    help="Serial port (default /dev/ttyUSB0), repeat to poll several adapters in parallel")
+parser.add_argument("-r", "--rate", type=float, default=None,
+                    help="Daemon poll rate in Hz on a fixed grid (default 5; with --tiered the fast-tier rate, default 10)")
+parser.add_argument("--overrun", choices=["skip", "compress"], default="skip",
+                    help="Daemon: skip missed slots after a slow poll, or run up to 3 of them back to back")
+parser.add_argument("--tiered", action="store_true",
+                    help="Daemon: read current/voltage at the -r rate with single-register reads, "
+                         "SOC and the rest in a 1 Hz full dump (one port and one BMS)")
+parser.add_argument("-i", "--bms-id", action="append", default=None,
+                    help="BMS ID in hex on a shared RS485 bus, repeat for several packs")
 args = parser.parse_args()
+if args.tiered and (len(args.port or ()) > 1 or len(args.bms_id or ()) > 1):
+    parser.error("--tiered polls a single BMS, give at most one -p and one -i")
+if args.deadband_set:
+    args.deadband = True
+if args.rate is None:
+    args.rate = 10.0 if args.tiered else 5.0
+
+setup_logging(args.log_level or ("info" if args.daemon else "debug"), timing=args.ptime == "show")
 
 # Zaregistrujeme signal handler pro Ctrl+C
 signal.signal(signal.SIGINT, signal_handler)
 
 
-# 4.2.4 COMMAND codes
-command_READ_ALL_DATA = b'\x06'
-source_HOST_PC = b'\x03'
-tx_type_READ_DATA = b'\x00'
-frame_STX = b'\x4E\x57'
-frame_LENGTH = b'\x00\x13'
-frame_BMS_ID = b'\x00\x00\x00\x00'
-frame_INFO_READ = b'\x00'
-frame_REC_NUM = b'\x00\x00\x00\x00'
-frame_END_FLAG = b'\x68'
-frame_CRC_HIGH = b'\x00\x00'
-frame_CRC_LOW = bytearray(2)
-
 # Start script execution
 script_start_time = time.time()
 
-# Create the request frame
-request_FRAME = bytearray()
-request_FRAME[0:2] = frame_STX
-request_FRAME[2:2] = frame_LENGTH
-request_FRAME[4:4] = frame_BMS_ID
-request_FRAME[8:1] = command_READ_ALL_DATA
-request_FRAME[9:1] = source_HOST_PC
-request_FRAME[10:1] = tx_type_READ_DATA
-request_FRAME[11:1] = frame_INFO_READ
-request_FRAME[12:4] = frame_REC_NUM
-request_FRAME[16:1] = frame_END_FLAG
-
-# Calculate CRC and insert into the frame
-crc_byte3, crc_byte4 = crc(request_FRAME[0:17])
-frame_CRC_LOW[0] = crc_byte3
-frame_CRC_LOW[1] = crc_byte4
-request_FRAME[17:2] = frame_CRC_HIGH
-request_FRAME[19:2] = frame_CRC_LOW
-
-port = "/dev/ttyUSB0"
+ports = args.port or ["/dev/ttyUSB0"]
+port = ports[0]
 baud = 115200
 
+# Jedno MQTT spojení na celý běh, připojuje se na pozadí
+mqtt_publisher = None
+if args.output == "mqtt":
+    mqtt_publisher = MqttPublisher(args.mqtt_host, args.mqtt_port, args.mqtt_topic, args.mqtt_qos, args.mqtt_retain)
+    mqtt_publisher.start()
+# Každý řádek nese čas přijetí rámce v ns, Influx ho tak nerazítkuje až při příchodu
+line_serializer = LineProtocolSerializer()
+mqtt_batcher = None
+last_warnings = {}
+deadband_filter = None
+if args.deadband:
+    deadband_filter = DeadbandFilter(parse_deadbands(args.deadband_set), keyframe_interval=args.keyframe)
+if mqtt_publisher is not None and args.batch > 1:
+    mqtt_batcher = LineBatcher(publish_payload, args.batch, args.batch_ms / 1000.0,
+                               b"" if args.format == "binary" else "\n")
+mqtt_spool = None
+mqtt_drainer = None
+if mqtt_publisher is not None and args.spool:
+    mqtt_spool = DiskSpool(args.spool, max_bytes=int(args.spool_max_mb * (1 << 20)))
+    mqtt_drainer = SpoolDrainer(mqtt_spool, mqtt_publisher.try_publish, lambda: mqtt_publisher.connected,
+                                args.spool_drain, separator=b"" if args.format == "binary" else b"\n")
+    mqtt_drainer.start()
+    if len(mqtt_spool):
+        mqtt_log.info("Spool %s holds %d bytes from a previous run", args.spool, len(mqtt_spool))
+publish_queue = None
+if mqtt_publisher is not None:
+    publish_queue = SinkQueue(send_data_to_mqtt, args.queue_size, args.backpressure, name="jkbms-mqtt")
+    publish_queue.start()
+
+# Deník surových odpovědí, zapisuje se přímo z BmsSerialSession.transact()
+frame_journal = FrameJournal(args.journal) if args.journal else None
+
+# Dotazové rámce se sestaví jednou, v cyklu se jen zapisuje hotový buffer
+request_frames = FrameLibrary()
+
+# Port i dekodéry si pamatují stav mezi cykly démona, každá BMS má svůj dekodér
+bms_session = BmsSerialSession(port, baud)
+if frame_journal is not None:
+    bms_session.on_response = frame_journal.append
+if args.bms_id:
+    bms_bus = BmsBus(bms_session, args.bms_id)
+    frame_decoders = {unit: IncrementalDecoder(raw=True) for unit in bms_bus.units}
+else:
+    bms_bus = None
+    frame_decoders = {None: IncrementalDecoder(raw=True)}
+scheduler = None
+fleet = None
+tiered_poller = None
+
+# Bez spojení by QoS 0 zahodilo první vzorek (u deadbandu první keyframe), se spoolem se jen uloží
+if mqtt_publisher is not None and mqtt_spool is None:
+    mqtt_publisher.wait_connected(5.0)
+
 # Hlavní smyčka skriptu
-if args.daemon:
-    print("Running in daemon mode...")
-    while True:
-        gather_and_send_data()
-        time.sleep(0.2)  # 5x za sekundu
+if len(ports) > 1:
+    # Flotila: jedno vlákno na adaptér, vzorky se zpracují zde v hlavním vlákně
+    daemon_log.info("Running fleet mode on %d ports...", len(ports))
+    fleet = BmsFleet(ports, baud, interval=1.0 / args.rate, bms_ids=args.bms_id, rounds=None if args.daemon else 1,
+                     journal=frame_journal)
+    fleet.start()
+    if args.daemon:
+        for sample in fleet.samples():
+            process_sample(sample)
+    else:
+        fleet.join()
+        for sample in fleet.samples(timeout=0):
+            process_sample(sample)
+elif args.daemon and args.tiered:
+    daemon_log.info("Running in tiered daemon mode, fast tier at %.2f Hz...", args.rate)
+    tiered_poller = TieredPoller(bms_session, default_tiers(args.rate),
+                                 bms_id=args.bms_id[0] if args.bms_id else BROADCAST_BMS_ID)
+    tiered_poller.run(process_sample)
+elif args.daemon:
+    daemon_log.info("Running in daemon mode at %.2f Hz...", args.rate)
+    # Pevná mřížka monotónních hodin, doba dotazu se do periody nezapočítává
+    scheduler = FixedRateScheduler(args.rate, args.overrun, report_interval=60.0)
+    scheduler.run(gather_and_send_data)
 else:
-    print("Running once...")
+    daemon_log.info("Running once...")
     gather_and_send_data()
-
-print(f"Total script execution time: {time.time() - script_start_time:.4f} seconds")
+if fleet is not None:
+    log_fleet_stats()
+log_bus_stats()
+bms_session.close()
+close_journal()
+close_mqtt()
+
+timing_log.debug("Total script execution time: %.4f seconds", time.time() - script_start_time)
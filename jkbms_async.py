@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import os
+
+import serial
+
+from jkbms_clock import receipt_time_ns
+from jkbms_decode import IncrementalDecoder
+from jkbms_frames import request_frame
+from jkbms_lineproto import LineProtocolSerializer
+from jkbms_log import LOG_LEVELS, LazyHex, get_logger, setup_logging
+from jkbms_mqtt import DEFAULT_BROKER, DEFAULT_PORT, DEFAULT_TOPIC, MqttPublisher
+from jkbms_sample import BmsSample
+from jkbms_stream import FrameParser
+
+serial_log = get_logger("serial")
+daemon_log = get_logger("daemon")
+
+READ_ALL_DATA_REQUEST = request_frame()
+
+
+# asyncio transport pro protokol JK-BMS (rámec 0x4E57)
+# Skutečný port se čte přes loop.add_reader() a zapisuje neblokujícím os.write() s loop.add_writer()
+# nad jeho deskriptorem, bez vlákna. URL bez deskriptoru (socket:// apod.) se krátce dotazují
+# přes in_waiting a zápis běží v executoru. Při chybě I/O se port zavře a poll() ho otevře znovu
+# až po backoff intervalu (exponenciálně roste, jako v BmsSerialSession), mezitím vrací None.
+# Bez hardwaru se testuje proti jkbms_emulator (pty nebo socket://).
+class AsyncBmsTransport:
+    def __init__(self, port, baud=115200, timeout=0.5, poll_interval=0.002, backoff_initial=0.5, backoff_max=30.0):
+        self.port = port
+        self.baud = baud
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.serial = None
+        self.reconnects = 0
+        self.errors = 0
+        self._backoff = backoff_initial
+        self._retry_at = 0.0
+        self.parser = FrameParser()
+        self._data_ready = None
+        self._fd = None
+        self._reader_task = None
+        self._lock = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self.serial is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._data_ready = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self.serial = serial.serial_for_url(self.port, self.baud, timeout=0, write_timeout=self.timeout)
+        try:
+            self._fd = self.serial.fileno()
+        except (AttributeError, NotImplementedError, OSError, serial.SerialException):
+            self._fd = None
+        if self._fd is not None:
+            os.set_blocking(self._fd, False)
+            loop.add_reader(self._fd, self._on_readable)
+        else:
+            self._reader_task = asyncio.create_task(self._poll_reader())
+        serial_log.debug("Opened %s at %s baud (asyncio)", self.port, self.baud)
+
+    async def close(self):
+        if self.serial is None:
+            return
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._fd = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        self.serial.close()
+        self.serial = None
+
+    def _schedule_retry(self, error):
+        self.errors += 1
+        self._retry_at = asyncio.get_running_loop().time() + self._backoff
+        serial_log.warning("Serial error on %s: %s (retry in %.1f s)", self.port, error, self._backoff)
+        self._backoff = min(self._backoff * 2, self.backoff_max)
+
+    # Otevře port, pokud už uplynul backoff, vrací True při otevřeném portu
+    async def _reopen(self):
+        if asyncio.get_running_loop().time() < self._retry_at:
+            return False
+        try:
+            await self.open()
+        except (serial.SerialException, OSError) as e:
+            self._drop(e)
+            return False
+        if self.errors:
+            self.reconnects += 1
+            serial_log.info("Reconnected to %s", self.port)
+        self._backoff = self.backoff_initial
+        return True
+
+    # Port zmizel (odpojený adaptér, spadlé TCP spojení), otevře se znovu po backoffu
+    def _drop(self, error):
+        self._schedule_retry(error)
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._fd = None
+        if self._reader_task is not None and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+        self._reader_task = None
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except (serial.SerialException, OSError):
+                pass
+            self.serial = None
+
+    def _on_readable(self):
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:
+            self._drop(e)
+            return
+        if data:
+            self.parser.feed(data)
+            self._data_ready.set()
+
+    async def _poll_reader(self):
+        while True:
+            try:
+                waiting = self.serial.in_waiting
+                # Některé URL (socket://) hlásí in_waiting jen 0/1, čte se tedy i to, co parser ještě potřebuje
+                data = self.serial.read(max(waiting, self.parser.needed())) if waiting else b""
+            except (serial.SerialException, OSError) as e:
+                self._drop(e)
+                return
+            if data:
+                self.parser.feed(data)
+                self._data_ready.set()
+            await asyncio.sleep(self.poll_interval)
+
+    # Zápis bez blokování smyčky: deskriptor neblokujícím os.write() (plný buffer = čekání
+    # na add_writer), URL port v executoru
+    async def _write(self, request):
+        loop = asyncio.get_running_loop()
+        if self._fd is None:
+            await loop.run_in_executor(None, self.serial.write, request)
+            return
+        fd = self._fd
+        view = memoryview(request)
+        while view:
+            try:
+                view = view[os.write(fd, view):]
+            except BlockingIOError:
+                writable = loop.create_future()
+                loop.add_writer(fd, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(fd)
+
+    async def _read_frame(self):
+        while True:
+            frame = self.parser.next_frame()
+            if frame is not None:
+                return frame
+            self._data_ready.clear()
+            await self._data_ready.wait()
+
+    # Pošle požadavek a počká na odpověď, při timeoutu vrací None
+    async def poll(self, request=READ_ALL_DATA_REQUEST):
+        if self.serial is None and not await self._reopen():
+            return None
+        async with self._lock:
+            self.parser.reset()
+            serial_log.debug("sending command: %s", LazyHex(request))
+            try:
+                await asyncio.wait_for(self._write(request), self.timeout)
+                frame = await asyncio.wait_for(self._read_frame(), self.timeout)
+            except asyncio.TimeoutError:
+                # Musí být před OSError, od Pythonu 3.11 je asyncio.TimeoutError podtřída OSError
+                self.parser.flush()
+                serial_log.warning("No response from %s within %.2f s", self.port, self.timeout)
+                return None
+            except (serial.SerialException, OSError) as e:
+                self._drop(e)
+                return None
+        serial_log.debug("Full response: %s", LazyHex(frame))
+        return frame
+
+
+# Smyčka dotazování jednoho portu, on_sample(sample) může být funkce i korutina
+# Rámce se dekódují inkrementálně jako v synchronních cestách, vzorek nese port.
+async def poll_forever(transport, interval, on_sample, request=READ_ALL_DATA_REQUEST):
+    loop = asyncio.get_running_loop()
+    next_time = loop.time()
+    decoder = IncrementalDecoder(raw=True)
+    while True:
+        frame = await transport.poll(request)
+        if frame is not None:
+            received_at = receipt_time_ns()
+            fields, changed = decoder.decode(frame)
+            sample = BmsSample.from_fields(fields, len(frame), received_at, changed)
+            sample.port = transport.port
+            result = on_sample(sample)
+            if asyncio.iscoroutine(result):
+                await result
+        next_time += interval
+        await asyncio.sleep(max(0.0, next_time - loop.time()))
+
+
+# Dotazování i odesílání na jedné smyčce: MqttPublisher.publish() jen předá zprávu síťovému
+# vláknu paho a nikdy neblokuje, bez MQTT se vzorky jen logují
+async def _main(ports, baud, interval, publisher=None):
+    serializer = LineProtocolSerializer()
+
+    def on_sample(sample):
+        if publisher is not None:
+            publisher.publish(serializer.serialize(sample))
+        daemon_log.debug("%s: %s", sample.port, sample)
+
+    transports = [AsyncBmsTransport(port, baud) for port in ports]
+    try:
+        await asyncio.gather(*(poll_forever(t, interval, on_sample) for t in transports))
+    finally:
+        for t in transports:
+            await t.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll one or more JK-BMS ports on a single asyncio event loop.")
+    parser.add_argument("ports", nargs="+", help="Serial ports or pyserial URLs")
+    parser.add_argument("-b", "--baud", type=int, default=115200)
+    parser.add_argument("-i", "--interval", type=float, default=0.2, help="Poll interval in seconds")
+    parser.add_argument("-o", "--output", choices=["mqtt", "none"], default="none",
+                        help="Publish samples as line protocol to MQTT (default: only log them)")
+    parser.add_argument("--mqtt-host", default=DEFAULT_BROKER, help=f"MQTT broker (default {DEFAULT_BROKER})")
+    parser.add_argument("--mqtt-port", type=int, default=DEFAULT_PORT, help=f"MQTT port (default {DEFAULT_PORT})")
+    parser.add_argument("--mqtt-topic", default=DEFAULT_TOPIC, help=f"MQTT topic (default {DEFAULT_TOPIC})")
+    parser.add_argument("-l", "--log-level", choices=list(LOG_LEVELS), default="info")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    publisher = None
+    if args.output == "mqtt":
+        publisher = MqttPublisher(args.mqtt_host, args.mqtt_port, args.mqtt_topic)
+        publisher.start()
+    try:
+        asyncio.run(_main(args.ports, args.baud, args.interval, publisher))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if publisher is not None:
+            publisher.close()
+            stats = publisher.stats()
+            daemon_log.info("MQTT: %d published, %d failed, %d disconnects",
+                            stats["published"], stats["failed"], stats["disconnects"])
@@ -0,0 +1,165 @@
+import numpy as np
+
+from jkbms_decode import (FRAME_STX, REGISTERS, BATTERY_STATUS_BITS, BATTERY_WARNINGS,
+                          decode_frame, iter_registers)
+
+# Dávkové dekódování archivu odpovědí READ_ALL_DATA do sloupců NumPy
+# Rámce se stejnou délkou mají (téměř vždy) stejné rozložení registrů, offsety se tedy
+# spočítají jednou z prvního rámce skupiny a celá skupina se dekóduje vektorově.
+
+_DTYPES = {("u", 1): '>u1', ("u", 2): '>u2', ("u", 4): '>u4', ("s", 2): '>i2', ("s", 4): '>i4',
+           ("temp", 2): '>u2', ("current", 2): '>u2'}
+
+_CHUNK_ROWS = 4096
+
+
+def _column_dtype(reg):
+    if reg.scale != 1:
+        return np.float64
+    if reg.codec in ("temp", "current", "s"):
+        return np.int32
+    return np.dtype(_DTYPES[(reg.codec, reg.width)]).newbyteorder('=')
+
+
+# Rozdělí souvislý buffer na rámce podle pole LENGTH, vrací pole začátků a délek
+def split_frames(buffer):
+    # Rychlá cesta: archiv rámců stejné délky bez mezer
+    if len(buffer) >= 4 and buffer[:2] == FRAME_STX:
+        length = ((buffer[2] << 8) | buffer[3]) + 2
+        if len(buffer) % length == 0:
+            view = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, length)
+            if np.all(view[:, 0] == 0x4E) and np.all(view[:, 1] == 0x57) and np.all(view[:, 2:4] == view[0, 2:4]):
+                count = len(view)
+                return np.arange(count, dtype=np.int64) * length, np.full(count, length, dtype=np.int64)
+
+    starts = []
+    lengths = []
+    pos = buffer.find(FRAME_STX)
+    end = len(buffer)
+    while 0 <= pos and pos + 4 <= end:
+        length = ((buffer[pos + 2] << 8) | buffer[pos + 3]) + 2
+        if pos + length > end:
+            break
+        starts.append(pos)
+        lengths.append(length)
+        pos = buffer.find(FRAME_STX, pos + length)
+    return np.array(starts, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+
+def _decode_column(block, reg, payload, width):
+    raw = np.ascontiguousarray(block[:, payload:payload + width]).view(_DTYPES[(reg.codec, width)]).ravel()
+    if reg.codec == "temp":
+        raw = raw.astype(np.int32)
+        value = np.where(raw <= 100, raw, 100 - raw)
+    elif reg.codec == "current":
+        raw = raw.astype(np.int32)
+        value = np.where(raw & 0x8000, raw & 0x7FFF, -raw)
+    else:
+        value = raw
+    if reg.scale != 1:
+        return value / reg.scale
+    return value
+
+
+def _decode_cells(block, payload, width):
+    count = width // 3
+    cells = block[:, payload:payload + count * 3].reshape(len(block), count, 3)[:, :, 1:3]
+    return np.ascontiguousarray(cells).view('>u2').reshape(len(block), count).astype(np.uint16)
+
+
+# frames: seznam bytes nebo jeden souvislý buffer s rámci za sebou
+# fields: volitelný výběr registrů podle názvu, výchozí jsou všechny číselné registry
+# Vrací {název: ndarray}, cell_voltages má tvar (počet rámců, max. počet článků) v mV
+def decode_batch(frames, fields=None):
+    if isinstance(frames, (bytes, bytearray, memoryview)):
+        buffer = bytes(frames)
+        starts, lengths = split_frames(buffer)
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        count = len(starts)
+        frame_at = lambda i: buffer[starts[i]:starts[i] + lengths[i]]
+    else:
+        buffer = None
+        lengths = np.fromiter((len(f) for f in frames), dtype=np.int64, count=len(frames))
+        count = len(frames)
+        frame_at = lambda i: frames[i]
+
+    wanted = [reg for reg in REGISTERS.values()
+              if reg.codec not in ("str", "cells") and (fields is None or reg.name in fields)]
+    with_cells = fields is None or "cell_voltages" in fields
+
+    # Skupiny podle délky rámce, rozložení registrů z prvního rámce skupiny
+    groups = []
+    max_cells = 0
+    for length in np.unique(lengths):
+        index = np.flatnonzero(lengths == length)
+        layout = list(iter_registers(frame_at(index[0])))
+        for reg_id, reg, payload, width in layout:
+            if reg_id == 0x79:
+                max_cells = max(max_cells, width // 3)
+        groups.append((int(length), index, layout))
+
+    result = {"valid": np.zeros(count, dtype=bool), "frame_length": lengths}
+    for reg in wanted:
+        dtype = _column_dtype(reg)
+        result[reg.name] = np.full(count, np.nan) if dtype == np.float64 else np.zeros(count, dtype=dtype)
+    if with_cells:
+        result["cell_voltages"] = np.zeros((count, max_cells), dtype=np.uint16)
+
+    for length, index, layout in groups:
+        if buffer is None:
+            block = np.frombuffer(b"".join(frames[i] for i in index), dtype=np.uint8).reshape(len(index), length)
+        else:
+            first = starts[index]
+            if len(index) > 1 and np.all(np.diff(first) == length):
+                # Rámce leží v bufferu těsně za sebou - pohled bez kopie
+                block = np.ndarray((len(index), length), dtype=np.uint8, buffer=buffer,
+                                   offset=int(first[0]), strides=(length, 1))
+            else:
+                block = data[first[:, None] + np.arange(length)]
+
+        # Rámce, jejichž ID registrů nesedí s rozložením skupiny, se dekódují jednotlivě
+        tag_positions = [payload - (2 if reg.width is None else 1) for _, reg, payload, _ in layout]
+        tag_ids = np.array([reg_id for reg_id, _, _, _ in layout], dtype=np.uint8)
+        matches = np.zeros(len(index), dtype=bool)
+
+        # Po blocích, aby se sloupce četly z rámců, které jsou ještě v cache
+        for chunk in range(0, len(index), _CHUNK_ROWS):
+            rows = block[chunk:chunk + _CHUNK_ROWS]
+            ok = np.all(rows[:, tag_positions] == tag_ids, axis=1) if layout else np.zeros(len(rows), dtype=bool)
+            matches[chunk:chunk + len(rows)] = ok
+            target = index[chunk:chunk + len(rows)][ok]
+            if ok.all():
+                ok = slice(None)
+            result["valid"][target] = True
+            for reg_id, reg, payload, width in layout:
+                if reg_id == 0x79:
+                    if with_cells:
+                        cells = _decode_cells(rows, payload, width)
+                        result["cell_voltages"][target, :cells.shape[1]] = cells[ok]
+                elif reg.name in result:
+                    result[reg.name][target] = _decode_column(rows, reg, payload, width)[ok]
+
+        for i in index[~matches]:
+            decoded = decode_frame(frame_at(i), raw=False)
+            if not decoded:
+                continue
+            result["valid"][i] = True
+            for reg in wanted:
+                if reg.name in decoded:
+                    result[reg.name][i] = decoded[reg.name]
+            if with_cells and "cell_voltages" in decoded:
+                cells = decoded["cell_voltages"]
+                matrix = result["cell_voltages"]
+                if len(cells) > matrix.shape[1]:
+                    # Jiné rozložení než první rámec skupiny, může mít víc článků - matice se rozšíří
+                    matrix = result["cell_voltages"] = np.pad(matrix, ((0, 0), (0, len(cells) - matrix.shape[1])))
+                matrix[i, :len(cells)] = cells
+
+    # Bitová pole 0x8B a 0x8C rozbalená vektorově
+    if "battery_warning" in result:
+        bits = np.arange(len(BATTERY_WARNINGS), dtype=np.uint16)
+        result["battery_warning_bits"] = ((result["battery_warning"][:, None] >> bits) & 1).astype(bool)
+    if "battery_status" in result:
+        for bit, name in enumerate(BATTERY_STATUS_BITS):
+            result[name] = ((result["battery_status"] >> bit) & 1).astype(bool)
+    return result
@@ -0,0 +1,88 @@
+import argparse
+import time
+
+from jkbms_bus import BmsBus
+from jkbms_clock import receipt_time_ns
+from jkbms_decode import IncrementalDecoder
+from jkbms_emulator import add_emulator_arguments, bus_from_arguments, serve_pty, serve_socket
+from jkbms_frames import FrameLibrary
+from jkbms_log import LOG_LEVELS, get_logger, setup_logging
+from jkbms_sample import BmsSample
+from jkbms_serial import BmsSerialSession
+
+bench_log = get_logger("bench")
+
+
+# Percentil ze seřazeného seznamu (nejbližší pořadí)
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# Stejná práce jako gather_and_send_data() bez výstupu: dotaz, dekódování, BmsSample
+# Vrací statistiky: rychlost dotazů a latence (dotaz až hotový vzorek) v sekundách
+def run_benchmark(session, polls=1000, bms_ids=None):
+    bus = BmsBus(session, bms_ids) if bms_ids else None
+    frames = FrameLibrary()
+    decoders = {}
+    latencies = []
+    samples = 0
+    started = time.perf_counter()
+    for _ in range(polls):
+        poll_started = time.perf_counter()
+        if bus is None:
+            unit = None
+            response = session.transact(frames.read_all())
+        else:
+            unit = bus.next_unit()
+            response = bus.poll_unit(unit)
+        if response and len(response) > 38:
+            decoder = decoders.get(unit)
+            if decoder is None:
+                decoder = decoders[unit] = IncrementalDecoder(raw=True)
+            fields, changed = decoder.decode(response)
+            BmsSample.from_fields(fields, len(response), receipt_time_ns(), changed)
+            samples += 1
+        latencies.append(time.perf_counter() - poll_started)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    stats = {
+        "polls": polls,
+        "samples": samples,
+        "elapsed": elapsed,
+        "poll_rate": polls / elapsed if elapsed > 0 else 0.0,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p90": percentile(latencies, 0.90),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": latencies[-1] if latencies else 0.0,
+    }
+    stats.update(session.parser.stats())
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure achievable poll rate and latency against a JK-BMS "
+                                                 "(emulated by default, or a real port with -p).")
+    parser.add_argument("-p", "--port", default=None, help="Real serial port or pyserial URL instead of the emulator")
+    parser.add_argument("--transport", choices=["pty", "tcp"], default="pty", help="Emulator transport")
+    parser.add_argument("-b", "--baud", type=int, default=115200)
+    parser.add_argument("-n", "--polls", type=int, default=1000)
+    parser.add_argument("-l", "--log-level", choices=list(LOG_LEVELS), default="warning")
+    add_emulator_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+
+    port = args.port
+    if port is None:
+        bus = bus_from_arguments(args)
+        port = serve_socket(bus) if args.transport == "tcp" else serve_pty(bus)
+    with BmsSerialSession(port, args.baud) as session:
+        stats = run_benchmark(session, args.polls, args.bms_id)
+    print(f"{port}: {stats['polls']} polls, {stats['samples']} samples in {stats['elapsed']:.2f} s")
+    print(f"poll rate: {stats['poll_rate']:.1f} polls/s")
+    print(f"latency p50 {stats['latency_p50'] * 1000:.2f} ms, p90 {stats['latency_p90'] * 1000:.2f} ms, "
+          f"p99 {stats['latency_p99'] * 1000:.2f} ms, max {stats['latency_max'] * 1000:.2f} ms")
+    print(f"frames: {stats['frames']} valid, {stats['corrupt']} corrupt, {stats['truncated']} truncated, "
+          f"{stats['resyncs']} resyncs, {stats['echoes']} echoes")
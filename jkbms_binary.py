@@ -0,0 +1,83 @@
+import struct
+import sys
+from array import array
+
+from jkbms_sample import BmsSample
+
+# Kompaktní binární záznam vzorku (little-endian), náhrada textového line protocol
+# Verze 2:
+#   version B, flags B (bit0 = následuje BMS_ID, bit1 = následuje port), timestamp Q (ns), voltage I (mV),
+#   current i (10 mA, kladný = nabíjení), soc B, 3 × teplota h (0.1 °C),
+#   battery_warning H, battery_status H, response_length H, počet článků B,
+#   [BMS_ID 4s], [délka portu B, port UTF-8], články n × H (mV)
+# Port (flotila více adaptérů) odpovídá tagu port v line protocol. Verze 1 je totéž bez portu
+# a dekóduje se dál. Záznamy se dají řetězit za sebe (dávka), každý se ohraničí počtem článků.
+SCHEMA_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+FLAG_BMS_ID = 0x01
+FLAG_PORT = 0x02
+
+_HEADER = struct.Struct('<BBQIiBhhhHHHB')
+_BMS_ID = struct.Struct('<4s')
+_BIG_ENDIAN_HOST = sys.byteorder == 'big'
+
+
+def encode_sample(sample):
+    cells = sample.cells
+    flags = (FLAG_BMS_ID if sample.bms_id else 0) | (FLAG_PORT if sample.port else 0)
+    header = _HEADER.pack(SCHEMA_VERSION, flags, sample.timestamp_ns, sample.voltage_mv,
+                          sample.current_10ma, sample.soc, sample.power_tube_temp_dc, sample.battery_box_temp_dc,
+                          sample.battery_temp_dc, sample.battery_warning, sample.battery_status,
+                          sample.response_length, len(cells))
+    if _BIG_ENDIAN_HOST:
+        cells = array('H', cells)
+        cells.byteswap()
+    if not flags:
+        return header + cells.tobytes()
+    parts = [header]
+    if flags & FLAG_BMS_ID:
+        parts.append(bytes.fromhex(sample.bms_id))
+    if flags & FLAG_PORT:
+        port = sample.port.encode()[:255]
+        parts.append(bytes((len(port),)))
+        parts.append(port)
+    parts.append(cells.tobytes())
+    return b"".join(parts)
+
+
+# Dekódování jednoho záznamu od offsetu, vrací (BmsSample, offset za záznamem)
+def decode_sample(payload, offset=0):
+    (version, flags, timestamp_ns, voltage_mv, current_10ma, soc, power_tube_temp_dc, battery_box_temp_dc,
+     battery_temp_dc, battery_warning, battery_status, response_length, cell_count) = _HEADER.unpack_from(payload, offset)
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"unsupported payload schema version {version}")
+    offset += _HEADER.size
+    bms_id = None
+    if flags & FLAG_BMS_ID:
+        bms_id = _BMS_ID.unpack_from(payload, offset)[0].hex()
+        offset += _BMS_ID.size
+    port = None
+    if flags & FLAG_PORT:
+        length = payload[offset]
+        port = bytes(payload[offset + 1:offset + 1 + length]).decode()
+        offset += 1 + length
+    end = offset + 2 * cell_count
+    if end > len(payload):
+        raise ValueError("truncated cell block")
+    cells = array('H', payload[offset:end])
+    if _BIG_ENDIAN_HOST:
+        cells.byteswap()
+    sample = BmsSample(timestamp_ns, voltage_mv, current_10ma, soc, power_tube_temp_dc, battery_box_temp_dc,
+                       battery_temp_dc, battery_warning, battery_status, cells, response_length, bms_id=bms_id,
+                       port=port)
+    return sample, end
+
+
+# Dávka záznamů za sebou (jedna MQTT zpráva), vrací seznam BmsSample
+def decode_samples(payload):
+    samples = []
+    offset = 0
+    while offset < len(payload):
+        sample, offset = decode_sample(payload, offset)
+        samples.append(sample)
+    return samples
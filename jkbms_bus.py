@@ -0,0 +1,95 @@
+import time
+
+from jkbms_frames import bms_id_bytes, command_READ_ALL_DATA, request_frame
+from jkbms_log import get_logger
+
+bus_log = get_logger("bus")
+
+# Na lince 8N1 zabere každý bajt 10 bitů
+BITS_PER_BYTE = 10
+
+
+# Více BMS na jedné lince RS485, rozlišené polem BMS_ID
+# Jednotky se dotazují váženým round-robinem (weight = kolikrát za kolo), odpověď se přiřadí
+# jednotce jen pokud BMS_ID v odpovědi sedí s dotazem. Počítá se i vytížení sběrnice.
+class BmsBus:
+    def __init__(self, session, bms_ids, weights=None, command=command_READ_ALL_DATA, register=None):
+        self.session = session
+        self.units = [bms_id_bytes(bms_id) for bms_id in bms_ids]
+        if not self.units:
+            raise ValueError("at least one BMS ID is required")
+        self.weights = list(weights) if weights is not None else [1] * len(self.units)
+        if len(self.weights) != len(self.units):
+            raise ValueError("weights must match bms_ids")
+        # Rámce pro každou jednotku ze sdílené cache request_frame()
+        self.requests = {unit: request_frame(command, unit, register) for unit in self.units}
+        self._current = [0] * len(self.units)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.polls = 0
+        self.timeouts = 0
+        self.id_mismatches = 0
+        self.bytes_on_wire = 0
+        self.busy_time = 0.0
+        self.started = time.monotonic()
+        self.unit_polls = dict.fromkeys(self.units, 0)
+
+    # Počet dotazů v jednom kole plánu
+    @property
+    def round_length(self):
+        return sum(self.weights)
+
+    # Smooth weighted round-robin: jednotky s vyšší vahou se prokládají rovnoměrně
+    def next_unit(self):
+        total = 0
+        best = 0
+        for i, weight in enumerate(self.weights):
+            self._current[i] += weight
+            total += weight
+            if self._current[i] > self._current[best]:
+                best = i
+        self._current[best] -= total
+        return self.units[best]
+
+    # Dotáže jednu jednotku, vrací odpověď nebo None (timeout / cizí BMS_ID)
+    def poll_unit(self, unit):
+        request = self.requests[unit]
+        started = time.monotonic()
+        response = self.session.transact(request)
+        self.busy_time += time.monotonic() - started
+        self.polls += 1
+        self.unit_polls[unit] += 1
+        self.bytes_on_wire += len(request) + len(response or b"")
+        if not response or len(response) < 8:
+            self.timeouts += 1
+            return None
+        if unit != b'\x00\x00\x00\x00' and response[4:8] != unit:
+            self.id_mismatches += 1
+            bus_log.warning("Response for BMS %s while polling %s", response[4:8].hex(), unit.hex())
+            return None
+        return response
+
+    # Další jednotka podle plánu, vrací (bms_id, odpověď nebo None)
+    def poll_next(self):
+        unit = self.next_unit()
+        return unit, self.poll_unit(unit)
+
+    # wire_utilization: podíl kapacity linky obsazený rámci
+    # busy_fraction: podíl času, kdy port čekal na transakci
+    # max_poll_rate: kolik dotazů za sekundu linka zvládne při průměrné délce transakce
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        baud = getattr(self.session, "baud", 115200)
+        avg_transaction = self.busy_time / self.polls if self.polls else 0.0
+        return {
+            "polls": self.polls,
+            "timeouts": self.timeouts,
+            "id_mismatches": self.id_mismatches,
+            "poll_rate": self.polls / elapsed,
+            "wire_utilization": self.bytes_on_wire * BITS_PER_BYTE / baud / elapsed,
+            "busy_fraction": self.busy_time / elapsed,
+            "avg_transaction": avg_transaction,
+            "max_poll_rate": 1.0 / avg_transaction if avg_transaction else 0.0,
+            "unit_polls": {unit.hex(): count for unit, count in self.unit_polls.items()},
+        }
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from jkbms_log import get_logger
+
+clock_log = get_logger("clock")
+
+
+# Reálný čas odvozený z monotónních hodin
+# time.time() může skákat (NTP, ruční nastavení), časové značky vzorků ale musí rovnoměrně růst.
+# Čas = kotva reálného času + uplynulý monotónní čas. Každých resync_interval s se kotva porovná
+# se skutečným časem: odchylka do step_threshold se dorovná plynule (nejvýše max_slew za resync),
+# větší odchylka (skok hodin) se převezme najednou. Mezi skoky čas nikdy neklesá; po skoku zpět
+# se převezme nový čas (jinak by všechny další vzorky dostaly stejnou značku a v Influxu se přepsaly).
+class MonotonicWallClock:
+    def __init__(self, resync_interval=10.0, step_threshold=1.0, max_slew=0.005):
+        self.resync_interval_ns = int(resync_interval * 1e9)
+        self.step_threshold_ns = int(step_threshold * 1e9)
+        self.max_slew_ns = int(max_slew * 1e9)
+        self._lock = threading.Lock()
+        self._anchor_mono = time.monotonic_ns()
+        self._offset = time.time_ns() - self._anchor_mono
+        self._last = 0
+        self.steps = 0
+
+    def _resync(self, mono):
+        error = time.time_ns() - mono - self._offset
+        if abs(error) > self.step_threshold_ns:
+            self.steps += 1
+            clock_log.warning("Wall clock stepped by %.3f s", error / 1e9)
+            self._offset += error
+            self._last = 0
+        else:
+            self._offset += max(-self.max_slew_ns, min(self.max_slew_ns, error))
+        self._anchor_mono = mono
+
+    def time_ns(self):
+        mono = time.monotonic_ns()
+        with self._lock:
+            if mono - self._anchor_mono >= self.resync_interval_ns:
+                self._resync(mono)
+            now = mono + self._offset
+            if now <= self._last:
+                now = self._last + 1
+            self._last = now
+        return now
+
+    def time(self):
+        return self.time_ns() / 1e9
+
+
+wall_clock = MonotonicWallClock()
+
+
+# Čas přijetí rámce pro BmsSample.timestamp_ns (ns, int)
+def receipt_time_ns():
+    return wall_clock.time_ns()
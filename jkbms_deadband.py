@@ -0,0 +1,106 @@
+import time
+
+from jkbms_sample import CELL_PREFIX, CELL_SCALE, FIELD_SCALES, scale_field
+
+# Výchozí pásma necitlivosti ve fyzikálních jednotkách (V, A, %, °C), 0 = každá změna
+# Pole voltage_cellN používají položku "voltage_cell", jinak cell_deadband.
+DEFAULT_DEADBANDS = {
+    "voltage": 0.05,
+    "current": 0.05,
+    "delta_voltage": 0.002,
+    "soc": 0,
+    "power_tube_temp": 0,
+    "battery_box_temp": 0,
+    "battery_temp": 0,
+    "response_length": 0,
+}
+DEFAULT_CELL_DEADBAND = 0.002
+
+
+# Odesílání jen změn: pole projde, pokud se od naposledy ODESLANÉ hodnoty posunulo o víc než
+# jeho pásmo (pomalý drift se tak neztratí). Každých keyframe_interval s se pošlou všechna pole,
+# aby se noví odběratelé dostali k úplnému stavu. Stav se vede zvlášť pro každý klíč (port, BMS ID).
+# Porovnává se v celočíselných jednotkách vzorku (mV, 10 mA, 0.1 °C), pásma se na ně převedou
+# jednou při vytvoření, posun přesně o pásmo tak neprojde nikdy (ve float V/A záleželo na zaokrouhlení).
+class DeadbandFilter:
+    def __init__(self, deadbands=None, cell_deadband=DEFAULT_CELL_DEADBAND, keyframe_interval=60.0,
+                 clock=time.monotonic):
+        self.deadbands = dict(DEFAULT_DEADBANDS if deadbands is None else deadbands)
+        self.cell_deadband = cell_deadband
+        self._bands = {name: _to_units(name, band) for name, band in self.deadbands.items()}
+        self._cell_band = _to_units(CELL_PREFIX, self.deadbands.get(CELL_PREFIX, cell_deadband))
+        self.keyframe_interval = keyframe_interval
+        self.clock = clock
+        self._published = {}
+        self._keyframe_at = {}
+        self.fields_in = 0
+        self.fields_out = 0
+        self.keyframes = 0
+
+    # Pásmo pole v celočíselných jednotkách
+    def _deadband(self, name):
+        band = self._bands.get(name)
+        if band is None:
+            band = self._cell_band if name.startswith(CELL_PREFIX) else 0
+        return band
+
+    # fields = sample.raw_fields(), vrací (pole k odeslání ve fyzikálních jednotkách, keyframe);
+    # prázdný dict = nic se nezměnilo
+    def filter(self, key, fields, now=None):
+        now = self.clock() if now is None else now
+        published = self._published.setdefault(key, {})
+        self.fields_in += len(fields)
+        if now >= self._keyframe_at.get(key, now):
+            self._keyframe_at[key] = now + self.keyframe_interval
+            published.update(fields)
+            self.fields_out += len(fields)
+            self.keyframes += 1
+            return {name: scale_field(name, value) for name, value in fields.items()}, True
+        out = {}
+        for name, value in fields.items():
+            last = published.get(name)
+            if last is None or abs(value - last) > self._deadband(name):
+                out[name] = scale_field(name, value)
+                published[name] = value
+        self.fields_out += len(out)
+        return out, False
+
+    def stats(self):
+        return {
+            "fields_in": self.fields_in,
+            "fields_out": self.fields_out,
+            "keyframes": self.keyframes,
+            "reduction": 1.0 - self.fields_out / self.fields_in if self.fields_in else 0.0,
+        }
+
+
+# Pásmo ve fyzikálních jednotkách převedené na celočíselné jednotky vzorku
+def _to_units(name, band):
+    scale = CELL_SCALE if name.startswith(CELL_PREFIX) else FIELD_SCALES.get(name, 1)
+    return round(band * scale)
+
+
+# Jedna položka z příkazové řádky "current=0.1", vrací (název, pásmo), jinak ValueError
+def parse_deadband(item):
+    name, _, value = item.partition("=")
+    name = name.strip()
+    if not value:
+        raise ValueError(f"deadband must be FIELD=VALUE, got {item!r}")
+    if name not in FIELD_SCALES and not name.startswith(CELL_PREFIX):
+        raise ValueError(f"unknown deadband field {name!r}, expected one of {', '.join(FIELD_SCALES)} or {CELL_PREFIX}")
+    try:
+        band = float(value)
+    except ValueError:
+        raise ValueError(f"deadband value must be a number, got {value!r}") from None
+    if band < 0:
+        raise ValueError(f"deadband must not be negative, got {band}")
+    return name, band
+
+
+# Přepis pásem z příkazové řádky: ["current=0.1", "soc=1"] nebo [("current", 0.1)]
+def parse_deadbands(items, deadbands=None):
+    deadbands = dict(DEFAULT_DEADBANDS if deadbands is None else deadbands)
+    for item in items or ():
+        name, band = parse_deadband(item) if isinstance(item, str) else item
+        deadbands[name] = band
+    return deadbands
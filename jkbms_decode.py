@@ -0,0 +1,338 @@
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 4.2 Frame Format - odpověď na READ_ALL_DATA
+# STX(2) LENGTH(2) BMS_ID(4) COMMAND(1) SOURCE(1) TX_TYPE(1) DATA(n) REC_NUM(4) END_FLAG(1) CRC(4)
+# LENGTH počítá bajty od pole LENGTH až po konec CRC, celý rámec má tedy LENGTH + 2 bajtů
+FRAME_STX = b'\x4E\x57'
+FRAME_DATA_OFFSET = 11
+FRAME_TRAILER_LENGTH = 9
+
+# Registrační tabulka: ID -> (název, šířka payloadu, měřítko, kodek), hodnota = raw / měřítko
+# width None = proměnná délka, první bajt payloadu udává počet bajtů (0x79)
+# codec: "u" unsigned big-endian, "s" signed big-endian, "temp" JK teplota (>100 záporná),
+#        "current" JK proud (bit15 = nabíjení), "str" ASCII text, "cells" blok napětí článků (array('H') v mV)
+Register = namedtuple("Register", "name width scale codec")
+
+REGISTERS = {
+    0x79: Register("cell_voltages", None, 1000, "cells"),
+    0x80: Register("power_tube_temp", 2, 1, "temp"),
+    0x81: Register("battery_box_temp", 2, 1, "temp"),
+    0x82: Register("battery_temp", 2, 1, "temp"),
+    0x83: Register("total_voltage", 2, 100, "u"),
+    0x84: Register("current", 2, 100, "current"),
+    0x85: Register("soc", 1, 1, "u"),
+    0x86: Register("temp_sensor_count", 1, 1, "u"),
+    0x87: Register("battery_cycle_count", 2, 1, "u"),
+    0x89: Register("battery_cycle_capacity", 4, 1, "u"),
+    0x8A: Register("total_strings", 2, 1, "u"),
+    0x8B: Register("battery_warning", 2, 1, "u"),
+    0x8C: Register("battery_status", 2, 1, "u"),
+    0x8E: Register("total_overvoltage_protection", 2, 100, "u"),
+    0x8F: Register("total_undervoltage_protection", 2, 100, "u"),
+    0x90: Register("cell_overvoltage_protection", 2, 1000, "u"),
+    0x91: Register("cell_overvoltage_recovery", 2, 1000, "u"),
+    0x92: Register("cell_overvoltage_delay", 2, 1, "u"),
+    0x93: Register("cell_undervoltage_protection", 2, 1000, "u"),
+    0x94: Register("cell_undervoltage_recovery", 2, 1000, "u"),
+    0x95: Register("cell_undervoltage_delay", 2, 1, "u"),
+    0x96: Register("cell_pressure_difference_protection", 2, 1000, "u"),
+    0x97: Register("discharge_overcurrent_protection", 2, 1, "u"),
+    0x98: Register("discharge_overcurrent_delay", 2, 1, "u"),
+    0x99: Register("charge_overcurrent_protection", 2, 1, "u"),
+    0x9A: Register("charge_overcurrent_delay", 2, 1, "u"),
+    0x9B: Register("balance_start_voltage", 2, 1000, "u"),
+    0x9C: Register("balance_opening_difference", 2, 1000, "u"),
+    0x9D: Register("active_balance_switch", 1, 1, "u"),
+    0x9E: Register("power_tube_temp_protection", 2, 1, "u"),
+    0x9F: Register("power_tube_temp_recovery", 2, 1, "u"),
+    0xA0: Register("battery_box_temp_protection", 2, 1, "u"),
+    0xA1: Register("battery_box_temp_recovery", 2, 1, "u"),
+    0xA2: Register("battery_temp_difference_protection", 2, 1, "u"),
+    0xA3: Register("charge_high_temp_protection", 2, 1, "u"),
+    0xA4: Register("discharge_high_temp_protection", 2, 1, "u"),
+    0xA5: Register("charge_low_temp_protection", 2, 1, "s"),
+    0xA6: Register("charge_low_temp_recovery", 2, 1, "s"),
+    0xA7: Register("discharge_low_temp_protection", 2, 1, "s"),
+    0xA8: Register("discharge_low_temp_recovery", 2, 1, "s"),
+    0xA9: Register("battery_strings_setting", 1, 1, "u"),
+    0xAA: Register("battery_capacity", 4, 1, "u"),
+    0xAB: Register("charging_mos_switch", 1, 1, "u"),
+    0xAC: Register("discharging_mos_switch", 1, 1, "u"),
+    0xAD: Register("current_calibration", 2, 1, "u"),
+    0xAE: Register("board_address", 1, 1, "u"),
+    0xAF: Register("battery_type", 1, 1, "u"),
+    0xB0: Register("sleep_wait_time", 2, 1, "u"),
+    0xB1: Register("low_capacity_alarm", 1, 1, "u"),
+    0xB2: Register("password", 10, 1, "str"),
+    0xB3: Register("dedicated_charger_switch", 1, 1, "u"),
+    0xB4: Register("device_id", 8, 1, "str"),
+    0xB5: Register("manufacture_date", 4, 1, "str"),
+    0xB6: Register("working_hours", 4, 1, "u"),
+    0xB7: Register("software_version", 15, 1, "str"),
+    0xB8: Register("current_calibration_status", 1, 1, "u"),
+    0xB9: Register("actual_battery_capacity", 4, 1, "u"),
+    0xBA: Register("manufacturer_id", 24, 1, "str"),
+    0xC0: Register("protocol_version", 1, 1, "u"),
+}
+
+# Bity 0x8B (varování) a 0x8C (stav baterie)
+BATTERY_WARNINGS = (
+    "Low capacity alarm",
+    "MOS tube overtemperature alarm",
+    "Charging overvoltage alarm",
+    "Discharge undervoltage alarm",
+    "Battery over temperature alarm",
+    "Charging overcurrent alarm",
+    "Discharge overcurrent alarm",
+    "Cell differential pressure alarm",
+    "Overtemperature alarm in battery box",
+    "Battery low temperature alarm",
+    "Monomer overvoltage alarm",
+    "Monomer undervoltage alarm",
+    "309_A protection alarm",
+    "309_B protection alarm",
+    "Reserved",
+    "Reserved",
+)
+BATTERY_STATUS_BITS = ("charging_mos", "discharging_mos", "balance_switch", "battery_dropped")
+
+REGISTERS_BY_NAME = {reg.name: reg for reg in REGISTERS.values()}
+
+_UNSIGNED = {1: struct.Struct('>B'), 2: struct.Struct('>H'), 4: struct.Struct('>I')}
+_SIGNED = {1: struct.Struct('>b'), 2: struct.Struct('>h'), 4: struct.Struct('>i')}
+
+
+def decode_temperature(temp_raw):
+    if temp_raw <= 100:
+        return temp_raw  # Kladná teplota
+    else:
+        return -(temp_raw - 100)  # Záporná teplota
+
+
+# Proud v jednotkách 10 mA, bit15 = nabíjení, jinak vybíjení
+def decode_current(current_raw):
+    if current_raw & 0x8000:
+        return current_raw & 0x7FFF
+    return -current_raw
+
+
+# Najde rámec v odpovědi a vrátí (začátek dat, konec dat)
+def frame_data_span(response):
+    start = response.find(FRAME_STX)
+    if start < 0 or start + 4 > len(response):
+        return None
+    length = (response[start + 2] << 8) | response[start + 3]
+    end = start + 2 + length
+    if end <= len(response):
+        stop = end - FRAME_TRAILER_LENGTH
+    else:
+        # Useknutý rámec - dekódujeme jen registry, které se vešly
+        stop = len(response)
+    return start + FRAME_DATA_OFFSET, stop
+
+
+# Jeden průchod rámcem: vrací (id, registr, pozice payloadu, délka payloadu)
+def iter_registers(response):
+    span = frame_data_span(response)
+    if span is None:
+        return
+    pos, stop = span
+    while pos < stop:
+        reg = REGISTERS.get(response[pos])
+        if reg is None:
+            break  # Neznámé ID, bez šířky nelze pokračovat
+        if reg.width is None:
+            if pos + 1 >= stop:
+                break
+            width = response[pos + 1]
+            payload = pos + 2
+        else:
+            width = reg.width
+            payload = pos + 1
+        if payload + width > stop:
+            break
+        yield response[pos], reg, payload, width
+        pos = payload + width
+
+
+def decode_register(response, reg, payload, width, raw=False):
+    codec = reg.codec
+    if codec == "cells":
+        return cell_voltages_array(response, payload, width)
+    if codec == "str":
+        return bytes(response[payload:payload + width]).decode("utf-8", errors="replace").rstrip("\x00")
+    if codec == "s":
+        value = _SIGNED[width].unpack_from(response, payload)[0]
+    else:
+        value = _UNSIGNED[width].unpack_from(response, payload)[0]
+        if codec == "temp":
+            value = decode_temperature(value)
+        elif codec == "current":
+            value = decode_current(value)
+    if raw or reg.scale == 1:
+        return value
+    return value / reg.scale
+
+
+# Blok 0x79 je [číslo článku, napětí H, napětí L] * n, napětí v mV
+# Vrací array('H') s mV bez vytváření objektu pro každý článek (článek i = index i - 1)
+def cell_voltages_array(response, payload, width):
+    count = width // 3
+    block = memoryview(response)[payload:payload + count * 3]
+    packed = bytearray(count * 2)
+    packed[0::2] = block[1::3]
+    packed[1::2] = block[2::3]
+    cells = array('H', packed)
+    if sys.byteorder == "little":
+        cells.byteswap()
+    return cells
+
+
+# Volitelný NumPy pohled '>u2' přímo nad bufferem odpovědi, bez kopie
+def cell_voltages_view(response):
+    if np is None:
+        raise RuntimeError("numpy is not installed")
+    for reg_id, reg, payload, width in iter_registers(response):
+        if reg_id == 0x79:
+            return np.ndarray((width // 3,), dtype='>u2', buffer=response, offset=payload + 1, strides=(3,))
+    return None
+
+
+# Dekóduje všechna pole rámce v jednom průchodu, vrací {název: hodnota}
+def decode_frame(response, raw=False):
+    fields = {}
+    for _, reg, payload, width in iter_registers(response):
+        fields[reg.name] = decode_register(response, reg, payload, width, raw)
+    return fields
+
+
+
+
+# Inkrementální dekodér pro po sobě jdoucí rámce z jedné BMS
+# Pamatuje si předchozí rámec a znovu dekóduje jen registry, jejichž bajty se změnily.
+# decode() vrací (fields, changed): fields je stejný slovník aktualizovaný na místě,
+# changed je množina názvů polí, jejichž hodnota se od minulého rámce změnila.
+class IncrementalDecoder:
+    def __init__(self, raw=False):
+        self.raw = raw
+        self.fields = {}
+        self._previous = None
+        self._layout = ()
+        self._structure = ()
+
+    def reset(self):
+        self.fields = {}
+        self._previous = None
+        self._layout = ()
+        self._structure = ()
+
+    def _same_layout(self, response, previous):
+        if len(response) != len(previous):
+            return False
+        # ID registrů a délkový bajt 0x79 určují rozložení rámce
+        for pos in self._structure:
+            if response[pos] != previous[pos]:
+                return False
+        return bool(self._layout)
+
+    def decode(self, response):
+        response = bytes(response)
+        previous = self._previous
+        if previous == response:
+            return self.fields, set()
+        self._previous = response
+
+        if previous is None or not self._same_layout(response, previous):
+            self._layout = tuple(iter_registers(response))
+            self._structure = tuple(pos for _, reg, payload, _ in self._layout
+                                    for pos in range(payload - (2 if reg.width is None else 1), payload))
+            old = self.fields
+            self.fields = {reg.name: decode_register(response, reg, payload, width, self.raw)
+                           for _, reg, payload, width in self._layout}
+            changed = {name for name, value in self.fields.items() if old.get(name) != value}
+            changed.update(name for name in old if name not in self.fields)
+            return self.fields, changed
+
+        changed = set()
+        fields = self.fields
+        for _, reg, payload, width in self._layout:
+            end = payload + width
+            if response[payload:end] != previous[payload:end]:
+                value = decode_register(response, reg, payload, width, self.raw)
+                if value != fields[reg.name]:
+                    fields[reg.name] = value
+                    changed.add(reg.name)
+        return fields, changed
+
+
+# Líný pohled nad surovou odpovědí: pole se dekóduje až při prvním přístupu a uloží se
+# view.total_voltage nebo view["total_voltage"], neznámé/chybějící pole vrací None
+# Rámec se prochází jen do nalezení požadovaného registru, napětí/proud/SOC jsou na začátku.
+class BmsFrameView:
+    __slots__ = ("response", "raw", "_walker", "_offsets", "_values")
+
+    def __init__(self, response, raw=False):
+        self.response = response
+        self.raw = raw
+        self._walker = iter_registers(response)
+        self._offsets = {}
+        self._values = {}
+
+    def _locate(self, name):
+        offsets = self._offsets
+        if name in offsets:
+            return offsets[name]
+        if self._walker is not None:
+            for _, reg, payload, width in self._walker:
+                offsets[reg.name] = (reg, payload, width)
+                if reg.name == name:
+                    return offsets[name]
+            self._walker = None
+        return None
+
+    def get(self, name, default=None):
+        values = self._values
+        if name in values:
+            return values[name]
+        location = self._locate(name)
+        if location is None:
+            return default
+        reg, payload, width = location
+        value = values[name] = decode_register(self.response, reg, payload, width, self.raw)
+        return value
+
+    def __getitem__(self, name):
+        if name not in REGISTERS_BY_NAME:
+            raise KeyError(name)
+        return self.get(name)
+
+    def __getattr__(self, name):
+        if name not in REGISTERS_BY_NAME:
+            raise AttributeError(name)
+        return self.get(name)
+
+    def __contains__(self, name):
+        return self._locate(name) is not None
+
+    def __len__(self):
+        return len(self.response)
+
+
+# Převede výstup decode_frame(raw=True) na fyzikální jednotky
+def scale_fields(fields):
+    scaled = {}
+    for name, value in fields.items():
+        reg = REGISTERS_BY_NAME[name]
+        if reg.scale == 1 or reg.codec in ("str", "cells"):
+            scaled[name] = value
+        else:
+            scaled[name] = value / reg.scale
+    return scaled
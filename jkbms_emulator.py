@@ -0,0 +1,367 @@
+import argparse
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+from jkbms_bus import BITS_PER_BYTE
+from jkbms_decode import BATTERY_STATUS_BITS, BATTERY_WARNINGS, FRAME_TRAILER_LENGTH, REGISTERS, decode_frame, iter_registers
+from jkbms_frames import (BROADCAST_BMS_ID, bms_id_bytes, build_request, command_READ, command_READ_ALL_DATA,
+                          source_BMS_DATA_BOX, tx_type_REPLY_FRAME)
+from jkbms_log import LOG_LEVELS, LazyHex, get_logger, setup_logging
+from jkbms_stream import FrameParser
+
+emulator_log = get_logger("emulator")
+
+# Výchozí hodnoty registrů v surových jednotkách (jak je posílá BMS), ostatní registry 0
+DEFAULT_REGISTER_VALUES = {
+    "temp_sensor_count": 3,
+    "battery_cycle_count": 42,
+    "battery_cycle_capacity": 12800,
+    "total_overvoltage_protection": 5840,
+    "total_undervoltage_protection": 4000,
+    "cell_overvoltage_protection": 3650,
+    "cell_overvoltage_recovery": 3550,
+    "cell_overvoltage_delay": 5,
+    "cell_undervoltage_protection": 2500,
+    "cell_undervoltage_recovery": 2600,
+    "cell_undervoltage_delay": 5,
+    "cell_pressure_difference_protection": 300,
+    "discharge_overcurrent_protection": 200,
+    "discharge_overcurrent_delay": 300,
+    "charge_overcurrent_protection": 100,
+    "charge_overcurrent_delay": 30,
+    "balance_start_voltage": 3400,
+    "balance_opening_difference": 10,
+    "active_balance_switch": 1,
+    "power_tube_temp_protection": 90,
+    "power_tube_temp_recovery": 70,
+    "battery_box_temp_protection": 70,
+    "battery_box_temp_recovery": 60,
+    "battery_temp_difference_protection": 20,
+    "charge_high_temp_protection": 55,
+    "discharge_high_temp_protection": 60,
+    "charge_low_temp_protection": 0,
+    "charge_low_temp_recovery": 5,
+    "discharge_low_temp_protection": -20,
+    "discharge_low_temp_recovery": -10,
+    "battery_capacity": 280,
+    "charging_mos_switch": 1,
+    "discharging_mos_switch": 1,
+    "current_calibration": 1000,
+    "battery_type": 1,
+    "sleep_wait_time": 10,
+    "low_capacity_alarm": 10,
+    "password": "123456",
+    "device_id": "60180019",
+    "manufacture_date": "2403",
+    "working_hours": 3600,
+    "software_version": "11.XW_S11.26___",
+    "actual_battery_capacity": 280,
+    "manufacturer_id": "JK_B2A8S20P",
+    "protocol_version": 1,
+}
+
+
+# Vzorová odpověď READ_ALL_DATA z dokumentu protokolu JK-BMS RS485 (JK-B1A24S15P, 14 článků),
+# nezávislá na tabulce REGISTERS: špatná šířka nebo ID registru v tabulce rozhodí průchod rámcem.
+# Pole CRC v tomto přepisu nesedí s daty (součet 0x5911), rámec se proto ověřuje jen rozložením
+# a hodnotami, ne součtem. Rámec zachycený z vlastní BMS (getAllData.py --journal) patří sem vedle něj.
+GOLDEN_FRAME = bytes.fromhex(
+    "4e57011b00000000060001792a010eed020efa030ef7040eec050ef8060efa070ef1080ef8090ee30a0efa0b0ef10c0e"
+    "fb0d0efb0e0ef280001d81001e82001c8314ef8480d0850f860287000489000001e08a000e8b00008c00078e16268f10"
+    "ae900fd2910fa0920005930beb940c8095000596012c9700079800039900059a00059b0ce49c00089d019e005a9f0046"
+    "a00064a10064a20014a30046a40046a5ffeca6fff6a7ffeca8fff6a90eaa00000140ab01ac01ad0411ae01af01b0000a"
+    "b114b231323334353600000000b300b4496e707574205573b532313031b60000e200b731312e58575f5331312e32365f"
+    "5f5fb800b900000400ba496e707574205573657264614a4b5f423141323453313550c0010000000068000054d1")
+
+# Hodnoty podle popisu polí v dokumentu protokolu (ne z REGISTERS)
+GOLDEN_VALUES = {
+    "cell_voltages": [3821, 3834, 3831, 3820, 3832, 3834, 3825, 3832, 3811, 3834, 3825, 3835, 3835, 3826],
+    "power_tube_temp": 29,
+    "battery_box_temp": 30,
+    "battery_temp": 28,
+    "total_voltage": 53.59,
+    "current": 2.08,
+    "soc": 15,
+    "total_strings": 14,
+    "battery_status": 7,
+    "password": "123456",
+    "software_version": "11.XW_S11.26___",
+    "manufacturer_id": "Input UserdaJK_B1A24S15P",
+    "protocol_version": 1,
+}
+
+
+# Ověří dekodér proti GOLDEN_FRAME: průchod registry musí skončit přesně před REC_NUM/END/CRC
+# a hodnoty sedět s GOLDEN_VALUES. Vrací seznam rozdílů (prázdný = v pořádku).
+def check_golden(frame=GOLDEN_FRAME, expected=GOLDEN_VALUES):
+    problems = []
+    layout = list(iter_registers(frame))
+    end = layout[-1][2] + layout[-1][3] if layout else 0
+    if end != len(frame) - FRAME_TRAILER_LENGTH:
+        problems.append(f"register walk stopped at byte {end} of {len(frame) - FRAME_TRAILER_LENGTH}")
+    fields = decode_frame(frame)
+    for name, value in expected.items():
+        actual = fields.get(name)
+        if name == "cell_voltages" and actual is not None:
+            actual = list(actual)
+        if actual != value:
+            problems.append(f"{name}: {actual!r} != {value!r}")
+    return problems
+
+# Teplota ve formátu JK (záporná = 100 + |t|)
+def encode_temperature(temp):
+    return temp if temp >= 0 else 100 - temp
+
+
+# Proud v 10 mA, nabíjení (kladný) s bitem 15, vybíjení bez něj
+def encode_current(current_10ma):
+    return 0x8000 | current_10ma if current_10ma >= 0 else -current_10ma
+
+
+# Softwarová BMS JK-B2A8S20P odpovídající na protokol 0x4E57
+# Stav: napětí článků (mV), proud (10 mA), SOC, teploty (°C), bity varování a stavu.
+# tick() posune stav náhodnou procházkou s šumem noise_mv / noise_10ma.
+# corrupt_rate / garbage_rate: podíl odpovědí s chybným součtem / se šumem před STX.
+class EmulatedBms:
+    def __init__(self, bms_id=BROADCAST_BMS_ID, cells=16, cell_mv=3300, current_10ma=-250, soc=80,
+                 temperatures=(25, 24, 23), warnings=(), noise_mv=2, noise_10ma=20, corrupt_rate=0.0,
+                 garbage_rate=0.0, seed=None):
+        self.bms_id = bms_id_bytes(bms_id)
+        self.random = random.Random(seed)
+        self.cell_mv = [cell_mv + self.random.randint(-10, 10) for _ in range(cells)]
+        self.current_10ma = current_10ma
+        self.soc = soc
+        self.temperatures = list(temperatures)
+        self.battery_warning = 0
+        for warning in warnings:
+            self.set_warning(warning)
+        self.battery_status = 0b0111
+        self.noise_mv = noise_mv
+        self.noise_10ma = noise_10ma
+        self.corrupt_rate = corrupt_rate
+        self.garbage_rate = garbage_rate
+        self.values = dict(DEFAULT_REGISTER_VALUES, total_strings=cells, battery_strings_setting=cells)
+        self.requests = 0
+
+    # Varování podle názvu z BATTERY_WARNINGS nebo podle čísla bitu
+    def set_warning(self, warning, active=True):
+        bit = warning if isinstance(warning, int) else BATTERY_WARNINGS.index(warning)
+        if active:
+            self.battery_warning |= 1 << bit
+        else:
+            self.battery_warning &= ~(1 << bit)
+
+    def set_status(self, name, active=True):
+        bit = BATTERY_STATUS_BITS.index(name)
+        if active:
+            self.battery_status |= 1 << bit
+        else:
+            self.battery_status &= ~(1 << bit)
+
+    def tick(self):
+        rnd = self.random
+        if self.noise_mv:
+            self.cell_mv = [max(0, mv + round(rnd.gauss(0, self.noise_mv))) for mv in self.cell_mv]
+        if self.noise_10ma:
+            self.current_10ma += round(rnd.gauss(0, self.noise_10ma))
+
+    def _live_values(self):
+        temps = self.temperatures + [0] * (3 - len(self.temperatures))
+        return {
+            "power_tube_temp": encode_temperature(temps[0]),
+            "battery_box_temp": encode_temperature(temps[1]),
+            "battery_temp": encode_temperature(temps[2]),
+            "total_voltage": sum(self.cell_mv) // 10,
+            "current": encode_current(self.current_10ma),
+            "soc": self.soc,
+            "battery_warning": self.battery_warning,
+            "battery_status": self.battery_status,
+        }
+
+    # DATA část odpovědi: [ID registru, payload] pro vybrané registry (None = všechny)
+    def encode_registers(self, only=None):
+        values = dict(self.values, **self._live_values())
+        data = bytearray()
+        for register_id, reg in REGISTERS.items():
+            if only is not None and register_id not in only:
+                continue
+            data.append(register_id)
+            if reg.codec == "cells":
+                data.append(3 * len(self.cell_mv))
+                for number, mv in enumerate(self.cell_mv, 1):
+                    data += struct.pack('>BH', number, mv)
+            elif reg.codec == "str":
+                data += str(values.get(reg.name, "")).encode('ascii')[:reg.width].ljust(reg.width, b'\x00')
+            else:
+                data += int(values.get(reg.name, 0)).to_bytes(reg.width, 'big', signed=reg.codec == "s")
+        return bytes(data)
+
+    # Odpověď na jeden požadavek, None pokud není pro tuto BMS
+    def respond(self, request):
+        requested_id = request[4:8]
+        if requested_id != BROADCAST_BMS_ID and requested_id != self.bms_id:
+            return None
+        command = request[8]
+        self.requests += 1
+        self.tick()
+        if command == command_READ:
+            data = self.encode_registers((request[11],))
+        elif command == command_READ_ALL_DATA:
+            data = self.encode_registers()
+        else:
+            # Zápis, aktivace, heslo: potvrzení bez dat
+            data = b''
+        response = build_request(command, self.bms_id, data, source_BMS_DATA_BOX, tx_type_REPLY_FRAME)
+        if self.corrupt_rate and self.random.random() < self.corrupt_rate:
+            response = bytearray(response)
+            response[-1] ^= 0xFF
+            response = bytes(response)
+        if self.garbage_rate and self.random.random() < self.garbage_rate:
+            response = bytes(self.random.randrange(256) for _ in range(self.random.randint(1, 8))) + response
+        return response
+
+
+# Více emulovaných BMS na jedné lince: každou odpověď pošle ta, jejíž BMS_ID sedí
+# Odpověď se pozdrží o čas, který by dotaz a odpověď zabraly na lince 8N1 při baud, plus turnaround
+# (zpracování v BMS), aby rychlost dotazování odpovídala skutečnému hardwaru. baud 0 = bez zpoždění.
+class EmulatedBus:
+    def __init__(self, units, baud=115200, turnaround=0.002):
+        self.units = list(units)
+        self.baud = baud
+        self.turnaround = turnaround
+        # Emulátor čte dotazy, ne odpovědi
+        self.parser = FrameParser(tx_type=None)
+        self._lock = threading.Lock()
+
+    # Přijatá data z linky, vrací odpovědi ke všem celým požadavkům (po zpoždění linky)
+    def receive(self, data):
+        responses = []
+        wire_time = 0.0
+        with self._lock:
+            self.parser.feed(data)
+            for request in self.parser:
+                emulator_log.debug("request: %s", LazyHex(request))
+                for unit in self.units:
+                    response = unit.respond(request)
+                    if response is not None:
+                        responses.append(response)
+                        if self.baud:
+                            wire_time += (len(request) + len(response)) * BITS_PER_BYTE / self.baud + self.turnaround
+                        break
+        if wire_time:
+            time.sleep(wire_time)
+        return b''.join(responses)
+
+
+def _serve_fd(bus, read_fd, write_fd):
+    while True:
+        try:
+            data = os.read(read_fd, 1024)
+        except OSError:
+            return
+        if not data:
+            return
+        response = bus.receive(data)
+        if response:
+            os.write(write_fd, response)
+
+
+# Emulátor na pty páru, vrací název slave zařízení (např. /dev/pts/3) pro -p / BmsSerialSession
+def serve_pty(bus):
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    threading.Thread(target=_serve_fd, args=(bus, master, master), name="jkbms-emulator-pty", daemon=True).start()
+    return os.ttyname(slave)
+
+
+def _serve_connection(bus, connection):
+    with connection:
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            try:
+                data = connection.recv(1024)
+            except OSError:
+                return
+            if not data:
+                return
+            response = bus.receive(data)
+            if response:
+                connection.sendall(response)
+
+
+# Emulátor na TCP, klient se připojí přes pyserial URL socket://host:port
+# port 0 = volný port, vrací URL
+def serve_socket(bus, host="127.0.0.1", port=0):
+    server = socket.create_server((host, port))
+
+    def accept():
+        while True:
+            connection, _ = server.accept()
+            threading.Thread(target=_serve_connection, args=(bus, connection), daemon=True).start()
+
+    threading.Thread(target=accept, name="jkbms-emulator-tcp", daemon=True).start()
+    host, port = server.getsockname()[:2]
+    return f"socket://{host}:{port}"
+
+
+def build_bus(bms_ids=None, cells=16, noise_mv=2, warnings=(), corrupt_rate=0.0, garbage_rate=0.0, seed=None,
+              baud=115200, turnaround=0.002):
+    bms_ids = bms_ids or [BROADCAST_BMS_ID]
+    return EmulatedBus((EmulatedBms(bms_id, cells=cells, noise_mv=noise_mv, warnings=warnings,
+                                    corrupt_rate=corrupt_rate, garbage_rate=garbage_rate,
+                                    seed=None if seed is None else seed + i)
+                        for i, bms_id in enumerate(bms_ids)), baud, turnaround)
+
+
+def add_emulator_arguments(parser):
+    parser.add_argument("--cells", type=int, default=16, help="Number of cells")
+    parser.add_argument("--noise", type=float, default=2, help="Cell voltage noise in mV (standard deviation)")
+    parser.add_argument("--alarm", action="append", default=[], type=int, metavar="BIT",
+                        help="Raise battery warning bit 0-15, repeatable")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="Share of responses with a bad checksum")
+    parser.add_argument("--garbage-rate", type=float, default=0.0, help="Share of responses with noise before STX")
+    parser.add_argument("-i", "--bms-id", action="append", default=None, help="Emulated BMS ID in hex, repeatable")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--line-baud", type=int, default=115200,
+                        help="Delay replies by the wire time at this baud rate (default 115200, 0 = no delay)")
+    parser.add_argument("--turnaround-ms", type=float, default=2.0,
+                        help="BMS processing time added to every reply (default 2 ms)")
+
+
+def bus_from_arguments(args):
+    return build_bus(args.bms_id, args.cells, args.noise, args.alarm, args.corrupt_rate, args.garbage_rate, args.seed,
+                     args.line_baud, args.turnaround_ms / 1000.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulate a JK-BMS on a pty or a TCP socket.")
+    parser.add_argument("--tcp", type=int, default=None, metavar="PORT", help="Listen on TCP (socket:// URL)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-l", "--log-level", choices=list(LOG_LEVELS), default="info")
+    parser.add_argument("--check", action="store_true", help="Check the decoder against the golden frame and exit")
+    add_emulator_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    if args.check:
+        problems = check_golden()
+        for problem in problems:
+            emulator_log.error("Golden frame: %s", problem)
+        if not problems:
+            emulator_log.info("Golden frame decodes as expected")
+        raise SystemExit(1 if problems else 0)
+    bus = bus_from_arguments(args)
+    if args.tcp is not None:
+        url = serve_socket(bus, args.host, args.tcp)
+    else:
+        url = serve_pty(bus)
+    emulator_log.info("Emulated BMS on %s", url)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
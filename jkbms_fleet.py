@@ -0,0 +1,118 @@
+import functools
+import queue
+import threading
+
+from jkbms_bus import BmsBus
+from jkbms_decode import IncrementalDecoder
+from jkbms_frames import request_frame
+from jkbms_log import get_logger
+from jkbms_sample import BmsSample
+from jkbms_schedule import FixedRateScheduler
+from jkbms_serial import BmsSerialSession
+
+fleet_log = get_logger("fleet")
+
+
+# Dotazování jednoho USB-RS485 adaptéru ve vlastním vlákně
+# Vzorky jdou do sdílené fronty, volitelně více BMS na portu přes BMS_ID (BmsBus)
+class PortWorker(threading.Thread):
+    def __init__(self, port, output, baud=115200, interval=0.2, bms_ids=None, rounds=None):
+        super().__init__(name=f"jkbms-{port}", daemon=True)
+        self.port = port
+        self.output = output
+        self.interval = interval
+        self.rounds = rounds
+        self.session = BmsSerialSession(port, baud)
+        self.bus = BmsBus(self.session, bms_ids) if bms_ids else None
+        self.request = request_frame()
+        self.decoders = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+        # Čekání přes stop event, aby stop() nemusel čekat na konec periody
+        self.scheduler = FixedRateScheduler(1.0 / interval, sleep=self._stop_event.wait)
+        self._rounds_done = 0
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _poll(self, bms_id):
+        if bms_id is None:
+            response = self.session.transact(self.request)
+        else:
+            response = self.bus.poll_unit(bms_id)
+        if not response or len(response) <= 38:
+            return
+        received_at = self.session.received_ns
+        decoder = self.decoders.get(bms_id)
+        if decoder is None:
+            decoder = self.decoders[bms_id] = IncrementalDecoder(raw=True)
+        fields, changed = decoder.decode(response)
+        sample = BmsSample.from_fields(fields, len(response), received_at, changed)
+        sample.port = self.port
+        if bms_id is not None:
+            sample.bms_id = bms_id.hex()
+        self.output.put(sample)
+        self.samples += 1
+
+    def _round(self):
+        if self.bus is None:
+            self._poll(None)
+        else:
+            for _ in range(self.bus.round_length):
+                self._poll(self.bus.next_unit())
+        self._rounds_done += 1
+
+    def _should_stop(self):
+        return self._stop_event.is_set() or (self.rounds is not None and self._rounds_done >= self.rounds)
+
+    def run(self):
+        try:
+            self.scheduler.run(self._round, self._should_stop)
+        finally:
+            self.session.close()
+
+
+# Flotila portů: jedno vlákno na adaptér, všechny plní jednu výstupní frontu
+# Práce je vázaná na I/O, takže propustnost roste s počtem adaptérů.
+# rounds = počet kol dotazů na port (None = do zastavení)
+# journal = FrameJournal pro surové odpovědi, kanál záznamu = index portu v ports
+class BmsFleet:
+    def __init__(self, ports, baud=115200, interval=0.2, bms_ids=None, maxsize=0, rounds=None, journal=None):
+        self.output = queue.Queue(maxsize)
+        self.workers = [PortWorker(port, self.output, baud, interval, bms_ids, rounds) for port in ports]
+        if journal is not None:
+            for channel, worker in enumerate(self.workers):
+                worker.session.on_response = functools.partial(journal.append, channel=channel)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        fleet_log.info("Polling %d ports: %s", len(self.workers), ", ".join(w.port for w in self.workers))
+
+    def stop(self, timeout=2.0):
+        for worker in self.workers:
+            worker.stop()
+        self.join(timeout)
+
+    def join(self, timeout=None):
+        for worker in self.workers:
+            worker.join(timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # Generátor vzorků ze všech portů v pořadí příchodu
+    def samples(self, timeout=None):
+        while True:
+            try:
+                yield self.output.get(timeout=timeout)
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {worker.port: dict(worker.scheduler.stats(), samples=worker.samples, **worker.session.parser.stats())
+                for worker in self.workers}
@@ -0,0 +1,94 @@
+import struct
+from functools import lru_cache
+
+# 4.2.4 COMMAND codes
+command_ACTIVATE = 0x01
+command_WRITE = 0x02
+command_READ = 0x03
+command_SEND_PASSWORD = 0x05
+command_READ_ALL_DATA = 0x06
+
+# FRAME SOURCE 0 BMS Data box 1 Bluetooth 2 GPS 3 PC Host Computer
+source_BMS_DATA_BOX = 0x00
+source_BLUETOOTH = 0x01
+source_GPS = 0x02
+source_HOST_PC = 0x03
+
+# Transmission type
+tx_type_READ_DATA = 0x00
+tx_type_REPLY_FRAME = 0x01
+tx_type_WRITE_DATA = 0x02
+
+frame_STX = b'\x4E\x57'
+frame_END_FLAG = 0x68
+BROADCAST_BMS_ID = b'\x00\x00\x00\x00'
+
+
+# Checksum 4bytes, bytes 1-2 0000 not used, bytes 3-4 cumulative total
+def checksum(data):
+    return sum(data) & 0xFFFF
+
+
+# Sestaví požadavek: STX LENGTH BMS_ID COMMAND SOURCE TX_TYPE INFO REC_NUM END_FLAG CRC
+# info = obsah pole INFO (READ_ALL_DATA 0x00, READ číslo registru, WRITE registr + data)
+def build_request(command=command_READ_ALL_DATA, bms_id=BROADCAST_BMS_ID, info=b'\x00',
+                  source=source_HOST_PC, tx_type=tx_type_READ_DATA, record_number=0):
+    body = struct.pack('>4sBBB', bytes(bms_id), command, source, tx_type) + bytes(info) + \
+        struct.pack('>IB', record_number, frame_END_FLAG)
+    length = 2 + len(body) + 4
+    frame = frame_STX + struct.pack('>H', length) + body
+    return frame + struct.pack('>I', checksum(frame))
+
+
+# BMS ID jako 4 bajty, přijímá int, hex řetězec ("00000001") nebo bytes
+def bms_id_bytes(bms_id):
+    if isinstance(bms_id, int):
+        return bms_id.to_bytes(4, 'big')
+    if isinstance(bms_id, str):
+        return bytes.fromhex(bms_id.zfill(8))
+    bms_id = bytes(bms_id)
+    if len(bms_id) != 4:
+        raise ValueError(f"BMS ID must have 4 bytes, got {len(bms_id)}")
+    return bms_id
+
+
+# Hotový rámec pro (příkaz, BMS ID, registr), sestaví se jen poprvé, pak se vrací z cache
+# register None = INFO 0x00 (READ_ALL_DATA, ACTIVATE), jinak číslo registru (READ)
+@lru_cache(maxsize=None)
+def _cached_request(command, bms_id, register):
+    info = b'\x00' if register is None else bytes([register])
+    return build_request(command, bms_id, info)
+
+
+def request_frame(command=command_READ_ALL_DATA, bms_id=BROADCAST_BMS_ID, register=None):
+    return _cached_request(command, bms_id_bytes(bms_id), register)
+
+
+# Předpočítané rámce pro konkrétní nasazení: všechny BMS ID × (READ_ALL_DATA + READ registrů)
+# frame() je jen vyhledání v dict, v cyklu se tak zapisuje rovnou hotový buffer bez sestavování.
+# Chybějící kombinace se doplní z cache request_frame().
+class FrameLibrary:
+    def __init__(self, bms_ids=(BROADCAST_BMS_ID,), registers=(), commands=(command_READ_ALL_DATA,)):
+        self.frames = {}
+        for bms_id in bms_ids:
+            bms_id = bms_id_bytes(bms_id)
+            for command in commands:
+                self.frames[command, bms_id, None] = _cached_request(command, bms_id, None)
+            for register in registers:
+                self.frames[command_READ, bms_id, register] = _cached_request(command_READ, bms_id, register)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, command=command_READ_ALL_DATA, bms_id=BROADCAST_BMS_ID, register=None):
+        try:
+            return self.frames[command, bms_id, register]
+        except KeyError:
+            frame = self.frames[command, bms_id, register] = request_frame(command, bms_id, register)
+            return frame
+
+    def read_all(self, bms_id=BROADCAST_BMS_ID):
+        return self.frame(command_READ_ALL_DATA, bms_id)
+
+    def read_register(self, register, bms_id=BROADCAST_BMS_ID):
+        return self.frame(command_READ, bms_id, register)
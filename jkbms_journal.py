@@ -0,0 +1,233 @@
+import argparse
+import bisect
+import itertools
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from jkbms_clock import wall_clock
+from jkbms_log import get_logger
+
+journal_log = get_logger("journal")
+
+# Záznam: čas přijetí v ns (uint64), délka rámce (uint16), kanál = index portu (uint8), rámec
+_RECORD = struct.Struct('<QHB')
+# Řídký index: (čas v ns, offset záznamu v segmentu) pro každý index_every-tý záznam
+_INDEX_ENTRY = struct.Struct('<QQ')
+# Povolené zpoždění záznamu za dosud nejnovějším časem segmentu (vlákna flotily si předbíhají zámek),
+# větší krok hodin zpět otevře nový segment
+REORDER_WINDOW_NS = 1_000_000_000
+_SEGMENT_SUFFIX = ".jkj"
+_INDEX_SUFFIX = ".idx"
+
+
+# Čas jako ns: datetime, nebo sekundy (float / int) od epochy
+def to_ns(value):
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return round(value * 1e9)
+
+
+# Deník surových odpovědí BMS do segmentových souborů (0000000001.jkj + 0000000001.idx)
+# Zápis je jen na konec, čas je značka přijetí od volajícího (stejná jako ve vzorku), záznamy jsou
+# v pořadí zápisu. Čas v segmentu smí couvnout nejvýš o REORDER_WINDOW_NS za dosavadní maximum
+# (víc vláken flotily), při větším kroku hodin zpět začne nový segment. Index zapisuje první
+# záznam segmentu a pak každý index_every-tý, hledání časového úseku tak nemusí číst celý soubor.
+class FrameJournal:
+    def __init__(self, directory, segment_bytes=16 << 20, index_every=64, sync_interval=5.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_every = index_every
+        self.sync_interval = sync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segment = max(list_segments(directory), default=0)
+        self._data = None
+        self._index = None
+        self._size = 0
+        self._records = 0
+        self._max_ns = 0
+        self._synced_at = time.monotonic()
+        self._closed = False
+        self.frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _roll(self):
+        self._close_files()
+        self._segment += 1
+        base = os.path.join(self.directory, f"{self._segment:010d}")
+        self._data = open(base + _SEGMENT_SUFFIX, "ab")
+        self._index = open(base + _INDEX_SUFFIX, "ab")
+        self._size = 0
+        self._records = 0
+        self._max_ns = 0
+        journal_log.debug("Journal segment %s", base + _SEGMENT_SUFFIX)
+
+    def _close_files(self):
+        for f in (self._data, self._index):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+        self._data = self._index = None
+
+    # Zapíše rámec, timestamp_ns = čas přijetí (BmsSerialSession.received_ns), None = teď
+    def append(self, frame, timestamp_ns=None, channel=0):
+        with self._lock:
+            if self._closed:
+                # Vlákna flotily mohou po zavření ještě chvíli dotazovat
+                return
+            if timestamp_ns is None:
+                timestamp_ns = wall_clock.time_ns()
+            if self._data is None or self._size >= self.segment_bytes:
+                self._roll()
+            elif timestamp_ns < self._max_ns - REORDER_WINDOW_NS:
+                journal_log.warning("Clock went back by %.3f s, new journal segment",
+                                    (self._max_ns - timestamp_ns) / 1e9)
+                self._roll()
+            self._max_ns = max(self._max_ns, timestamp_ns)
+            if self._records % self.index_every == 0:
+                self._index.write(_INDEX_ENTRY.pack(timestamp_ns, self._size))
+            self._data.write(_RECORD.pack(timestamp_ns, len(frame), channel))
+            self._data.write(frame)
+            self._size += _RECORD.size + len(frame)
+            self._records += 1
+            self.frames += 1
+            now = time.monotonic()
+            if now - self._synced_at >= self.sync_interval:
+                self.flush()
+                self._synced_at = now
+
+    def flush(self):
+        if self._data is not None:
+            self._data.flush()
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._close_files()
+
+
+def list_segments(directory):
+    return sorted(int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                  if name.endswith(_SEGMENT_SUFFIX))
+
+
+# Čtení deníku přes mmap. Časy v segmentu nejsou přísně seřazené, jen žádný záznam není o víc
+# než REORDER_WINDOW_NS starší než maximum před ním. Z toho:
+# - segment obsahuje časy v [první čas - okno, maximum segmentu], prochází se rozsah každého
+#   segmentu (po kroku hodin zpět mají pozdější segmenty dřívější časy a musí se najít také),
+# - v segmentu se skočí binárním hledáním v průběžném maximu indexu, záznamy před bodem, kde
+#   maximum dosáhne start - okno, už nemohou ležet v úseku,
+# - čtení končí na prvním záznamu novějším než end + okno.
+# Rámce se vrací v pořadí zápisu, po kroku hodin tedy nemusí být seřazené podle času.
+class JournalReader:
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        for segment in list_segments(directory):
+            times, offsets = self._load_index(segment)
+            if times:
+                self.segments.append((segment, times, offsets, array('Q', itertools.accumulate(times, max))))
+        # Horní mez času uzavřených segmentů: maximum indexu + okno, nebo víc v konci za posledním bodem
+        # indexu. Poslední segment se může ještě dopisovat, bez meze.
+        self.last_ns = [max(running[-1] + REORDER_WINDOW_NS,
+                            max((t for t, _, _ in self._scan(segment, offsets[-1], 0, (1 << 64) - 1)), default=0))
+                        for segment, _, offsets, running in self.segments[:-1]]
+        if self.segments:
+            self.last_ns.append((1 << 64) - 1)
+
+    def _path(self, segment, suffix):
+        return os.path.join(self.directory, f"{segment:010d}{suffix}")
+
+    # (časy, offsety) ze souboru .idx
+    def _load_index(self, segment):
+        entries = array('Q')
+        try:
+            with open(self._path(segment, _INDEX_SUFFIX), "rb") as f:
+                data = f.read()
+        except OSError:
+            return array('Q'), array('Q')
+        entries.frombytes(data[:len(data) - len(data) % _INDEX_ENTRY.size])
+        if sys.byteorder != "little":
+            entries.byteswap()
+        return entries[0::2], entries[1::2]
+
+    # Záznamy segmentu od offsetu s časem v [start_ns, end_ns] jako (ns, kanál, rámec),
+    # do konce souboru nebo do záznamu novějšího než end_ns + okno
+    def _scan(self, segment, offset, start_ns, end_ns):
+        with open(self._path(segment, _SEGMENT_SUFFIX), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                while offset + _RECORD.size <= size:
+                    timestamp_ns, length, channel = _RECORD.unpack_from(data, offset)
+                    end = offset + _RECORD.size + length
+                    if end > size or timestamp_ns > end_ns + REORDER_WINDOW_NS:
+                        # Useknutý záznam (rozepsaný segment) nebo konec úseku
+                        return
+                    if start_ns <= timestamp_ns <= end_ns:
+                        yield timestamp_ns, channel, data[offset + _RECORD.size:end]
+                    offset = end
+
+    # Rámce s časem přijetí v [start, end], start/end = datetime nebo sekundy od epochy
+    def frames_between(self, start=0, end=None):
+        start_ns = to_ns(start)
+        end_ns = to_ns(end) if end is not None else (1 << 64) - 1
+        for (segment, times, offsets, running), last_ns in zip(self.segments, self.last_ns):
+            if times[0] - REORDER_WINDOW_NS > end_ns or last_ns < start_ns:
+                continue
+            # Úsek mezi body indexu i a i+1 má časy nejvýš running[i+1] + okno
+            point = max(0, bisect.bisect_left(running, start_ns - REORDER_WINDOW_NS) - 1)
+            yield from self._scan(segment, offsets[point], start_ns, end_ns)
+
+    def __iter__(self):
+        return self.frames_between()
+
+    # Úsek dekódovaný najednou přes jkbms_batch.decode_batch (numpy), přidá sloupec timestamp_ns
+    def decode_between(self, start=0, end=None, fields=None, channel=None):
+        from jkbms_batch import decode_batch, np
+        timestamps = []
+        frames = []
+        for timestamp_ns, frame_channel, frame in self.frames_between(start, end):
+            if channel is None or frame_channel == channel:
+                timestamps.append(timestamp_ns)
+                frames.append(frame)
+        columns = decode_batch(frames, fields)
+        columns["timestamp_ns"] = np.array(timestamps, dtype=np.uint64)
+        return columns
+
+
+def _parse_time(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text)
+
+
+if __name__ == "__main__":
+    from jkbms_decode import decode_frame
+
+    parser = argparse.ArgumentParser(description="Replay raw frames from a JK-BMS journal.")
+    parser.add_argument("directory")
+    parser.add_argument("--from", dest="start", type=_parse_time, default=0,
+                        help="Start time, ISO (2026-10-17 14:02:10) or epoch seconds")
+    parser.add_argument("--to", dest="end", type=_parse_time, default=None, help="End time, ISO or epoch seconds")
+    parser.add_argument("--decode", action="store_true", help="Print decoded fields instead of hex")
+    args = parser.parse_args()
+
+    for timestamp_ns, channel, frame in JournalReader(args.directory).frames_between(args.start, args.end):
+        stamp = datetime.fromtimestamp(timestamp_ns / 1e9).isoformat(timespec="microseconds")
+        print(stamp, channel, decode_frame(frame) if args.decode else frame.hex())
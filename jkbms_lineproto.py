@@ -0,0 +1,124 @@
+import argparse
+import timeit
+
+from jkbms_sample import BmsSample
+
+DEFAULT_MEASUREMENT = "battery_measurements"
+
+
+# Text hodnoty v mV jako V ("3.312"), stejně jako str(mv / 1000.0), ale jen jednou pro každou hodnotu
+class _MillisText(dict):
+    def __missing__(self, value):
+        text = self[value] = str(value / 1000.0)
+        return text
+
+
+# Hotový úsek ",voltage_cellN=3.312" pro jeden článek, pamatuje se pro každé napětí
+class _CellText(dict):
+    def __init__(self, key):
+        super().__init__()
+        self.key = key
+
+    def __missing__(self, value):
+        text = self[value] = f"{self.key}{value / 1000.0}"
+        return text
+
+
+# Serializace BmsSample do Influx line protocol
+# Měření a tagy (port, BMS ID) se složí jednou pro každou jednotku, klíče článků
+# (",voltage_cell12=") jednou pro každý počet článků a celé úseky ",voltage_cell12=3.312" se
+# pamatují pro každé napětí (články se drží v úzkém rozsahu), takže cyklus jen skládá hotové řetězce.
+# Časová značka v ns = čas přijetí rámce (sample.timestamp_ns).
+class LineProtocolSerializer:
+    def __init__(self, measurement=DEFAULT_MEASUREMENT, timestamps=True):
+        self.measurement = measurement
+        self.timestamps = timestamps
+        self._prefixes = {}
+        self._cell_texts = {}
+        self._millis = _MillisText()
+
+    def _prefix(self, sample):
+        key = (sample.port, sample.bms_id)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            tags = f",port={sample.port}" if sample.port else ""
+            tags += f",bms_id={sample.bms_id}" if sample.bms_id else ""
+            prefix = self._prefixes[key] = f"{self.measurement}{tags} voltage="
+        return prefix
+
+    def _cell_texts_for(self, count):
+        texts = self._cell_texts.get(count)
+        if texts is None:
+            texts = self._cell_texts[count] = tuple(_CellText(f",voltage_cell{cell}=") for cell in range(1, count + 1))
+        return texts
+
+    # Celý vzorek, pole ve stejném pořadí jako BmsSample.fields()
+    def serialize(self, sample):
+        millis = self._millis
+        cells = sample.cells
+        parts = [
+            self._prefix(sample), str(sample.voltage_mv / 1000.0),
+            ",current=", str(sample.current_10ma / 100.0),
+            ",delta_voltage=", millis[max(cells) - min(cells) if cells else 0],
+            ",soc=", str(sample.soc),
+            ",power_tube_temp=", str(sample.power_tube_temp_dc / 10.0),
+            ",battery_box_temp=", str(sample.battery_box_temp_dc / 10.0),
+            ",battery_temp=", str(sample.battery_temp_dc / 10.0),
+        ]
+        parts += [texts[voltage_mv] for texts, voltage_mv in zip(self._cell_texts_for(len(cells)), cells)]
+        parts.append(",response_length=")
+        parts.append(str(sample.response_length))
+        if self.timestamps:
+            parts.append(" ")
+            parts.append(str(sample.timestamp_ns))
+        return "".join(parts)
+
+    # Jen vybraná pole (deadband), fields = podmnožina sample.fields()
+    def serialize_fields(self, sample, fields):
+        line = self._prefix(sample)[:-len("voltage=")] + ",".join([f"{name}={value}" for name, value in fields.items()])
+        if self.timestamps:
+            line += f" {sample.timestamp_ns}"
+        return line
+
+
+# Původní skládání řádku (f-string a join přes všechna pole) pro srovnání v benchmarku
+def _naive_line(sample):
+    cell_voltage_data = ",".join([f"voltage_cell{cell}={voltage_mv / 1000.0}"
+                                  for cell, voltage_mv in enumerate(sample.cells, 1)])
+    tags = f",port={sample.port}" if sample.port else ""
+    tags += f",bms_id={sample.bms_id}" if sample.bms_id else ""
+    return (f"battery_measurements{tags} voltage={sample.voltage},current={sample.current},"
+            f"delta_voltage={sample.delta_voltage},soc={sample.soc},power_tube_temp={sample.power_tube_temp},"
+            f"battery_box_temp={sample.battery_box_temp},battery_temp={sample.battery_temp},"
+            f"{cell_voltage_data},response_length={sample.response_length} {sample.timestamp_ns}")
+
+
+if __name__ == "__main__":
+    from array import array
+    import random
+
+    parser = argparse.ArgumentParser(description="Microbenchmark of the line-protocol serializer.")
+    parser.add_argument("--cells", type=int, default=16)
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    samples = [BmsSample(1700000000 * 10**9 + i * 100000000, 52800 + rnd.randint(-20, 20), rnd.randint(-300, 300), 80,
+                         250, 240, 230, 0, 7, array('H', (3300 + rnd.randint(-8, 8) for _ in range(args.cells))), 267,
+                         port="/dev/ttyUSB0")
+               for i in range(256)]
+    serializer = LineProtocolSerializer()
+    assert all(serializer.serialize(s) == _naive_line(s) for s in samples)
+
+    def run(function):
+        index = [0]
+
+        def one():
+            function(samples[index[0] & 255])
+            index[0] += 1
+        return min(timeit.repeat(one, number=args.number, repeat=5)) / args.number
+
+    naive = run(_naive_line)
+    fast = run(serializer.serialize)
+    print(f"{args.cells} cells: naive {naive * 1e6:.2f} us/sample, serializer {fast * 1e6:.2f} us/sample, "
+          f"{naive / fast:.1f}x")
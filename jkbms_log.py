@@ -0,0 +1,47 @@
+import logging
+import sys
+
+# Logování po subsystémech: jkbms.serial, jkbms.decode, jkbms.mqtt, jkbms.timing, jkbms.daemon
+# Zprávy se předávají jako "%s" + argumenty, formátují se až když je úroveň povolená.
+
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "silent": None,
+}
+
+
+def get_logger(subsystem):
+    return logging.getLogger(f"jkbms.{subsystem}")
+
+
+# level: klíč z LOG_LEVELS, "silent" vypne veškerý výstup
+# timing: zapne ladicí výpisy časů (dříve -t show) nezávisle na úrovni ostatních loggerů
+def setup_logging(level="info", timing=False, stream=None):
+    root = logging.getLogger("jkbms")
+    root.propagate = False
+    root.handlers[:] = []
+    if LOG_LEVELS[level] is None:
+        root.addHandler(logging.NullHandler())
+        logging.disable(logging.CRITICAL)
+        return
+
+    logging.disable(logging.NOTSET)
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVELS[level])
+    get_logger("timing").setLevel(logging.DEBUG if timing else logging.CRITICAL + 1)
+
+
+# Hex dump, který se spočítá až při skutečném výpisu
+class LazyHex:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return self.data.hex()
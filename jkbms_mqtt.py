@@ -0,0 +1,172 @@
+import threading
+
+import paho.mqtt.client as mqtt
+
+from jkbms_log import get_logger
+
+mqtt_log = get_logger("mqtt")
+
+DEFAULT_BROKER = "127.0.0.1"
+DEFAULT_PORT = 1883
+DEFAULT_TOPIC = "jkbms-test"
+
+
+# Jedno dlouhodobé MQTT spojení pro celý běh démona
+# Připojení i síťová smyčka běží na pozadí (connect_async + loop_start), paho se po výpadku
+# brokeru připojuje znovu sám s backoffem reconnect_min..reconnect_max s.
+# publish() nikdy neblokuje na síti. Zprávy QoS 1/2 paho bez spojení podrží (do max_queued zpráv)
+# a doručí je smyčka na pozadí po připojení, QoS 0 bez spojení propadne (počítá se do failed).
+# client = vlastní klient s rozhraním paho (např. pro testy), jinak se vytvoří paho Client.
+class MqttPublisher:
+    def __init__(self, broker=DEFAULT_BROKER, port=DEFAULT_PORT, topic=DEFAULT_TOPIC, qos=0, retain=False,
+                 client_id="", keepalive=60, username=None, password=None, reconnect_min=1, reconnect_max=60,
+                 max_queued=1000, client=None):
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.qos = qos
+        self.retain = retain
+        self.keepalive = keepalive
+        if client is None:
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        self.client = client
+        if username is not None:
+            client.username_pw_set(username, password)
+        client.reconnect_delay_set(reconnect_min, reconnect_max)
+        client.max_queued_messages_set(max_queued)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        self._connected = threading.Event()
+        self.published = 0
+        self.failed = 0
+        self.disconnects = 0
+        self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if reason_code.is_failure:
+            mqtt_log.warning("MQTT broker %s:%s refused connection: %s", self.broker, self.port, reason_code)
+            return
+        mqtt_log.info("Connected to MQTT broker %s:%s", self.broker, self.port)
+        self._connected.set()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        if self._connected.is_set():
+            self.disconnects += 1
+            mqtt_log.warning("Disconnected from MQTT broker %s:%s: %s", self.broker, self.port, reason_code)
+        self._connected.clear()
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.client.connect_async(self.broker, self.port, self.keepalive)
+        self.client.loop_start()
+
+    # Počká na první připojení, vrací False po timeoutu
+    def wait_connected(self, timeout=None):
+        return self._connected.wait(timeout)
+
+    def publish(self, payload, topic=None, qos=None, retain=None):
+        qos = self.qos if qos is None else qos
+        info = self.client.publish(topic or self.topic, payload, qos, self.retain if retain is None else retain)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS or (info.rc == mqtt.MQTT_ERR_NO_CONN and qos > 0):
+            # MQTT_ERR_NO_CONN u QoS > 0: zpráva čeká ve frontě paho na znovupřipojení
+            self.published += 1
+        else:
+            self.failed += 1
+            mqtt_log.warning("MQTT publish to '%s' failed: %s", topic or self.topic, mqtt.error_string(info.rc))
+        return info
+
+    # Odeslání jen při živém spojení, vrací True pokud zprávu převzal paho (pro spool při výpadku)
+    def try_publish(self, payload, topic=None):
+        if not self.connected:
+            return False
+        return self.publish(payload, topic).rc == mqtt.MQTT_ERR_SUCCESS
+
+    def close(self):
+        if not self._started:
+            return
+        self._started = False
+        # Vlastní odpojení se nepočítá jako výpadek
+        self._connected.clear()
+        try:
+            self.client.disconnect()
+        finally:
+            self.client.loop_stop()
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "published": self.published,
+            "failed": self.failed,
+            "disconnects": self.disconnects,
+        }
+
+
+# Dávkování: řádky se sbírají a odešlou jednou zprávou (spojené separator) po max_lines řádcích
+# nebo max_delay s od prvního řádku dávky, podle toho co nastane dřív.
+# add(..., urgent=True) (alarm) odešle dávku hned i s tímto řádkem.
+# send = funkce přijímající payload, typicky MqttPublisher.publish
+# separator "\n" pro line protocol, b"" pro binární záznamy (jkbms_binary), které se ohraničí samy
+class LineBatcher:
+    def __init__(self, send, max_lines=10, max_delay=1.0, separator="\n"):
+        self.send = send
+        self.separator = separator
+        self.max_lines = max_lines
+        self.max_delay = max_delay
+        self._lines = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self.batches = 0
+        self.lines = 0
+
+    def add(self, line, urgent=False):
+        with self._lock:
+            self._lines.append(line)
+            if urgent or len(self._lines) >= self.max_lines:
+                payload = self._take()
+            else:
+                payload = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if payload is not None:
+            self.send(payload)
+
+    # Vyjme dávku, volá se pod zámkem
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._lines:
+            return None
+        payload = self.separator.join(self._lines)
+        self.batches += 1
+        self.lines += len(self._lines)
+        self._lines = []
+        return payload
+
+    def flush(self):
+        with self._lock:
+            payload = self._take()
+        if payload is not None:
+            self.send(payload)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "lines": self.lines,
+            "lines_per_batch": self.lines / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,126 @@
+import collections
+import threading
+import time
+
+from jkbms_log import get_logger
+
+queue_log = get_logger("queue")
+
+BACKPRESSURE_POLICIES = ("drop-oldest", "drop-newest", "block")
+
+
+# Omezená fronta mezi dotazováním BMS a výstupem (MQTT apod.) s vlastním pracovním vláknem
+# Vzorkovací smyčka jen vloží položku, pomalý nebo nedostupný výstup ji tak nezdrží.
+# Při plné frontě podle policy:
+#   "drop-oldest" - zahodí nejstarší položku (výchozí, výstup dostává nejčerstvější data)
+#   "drop-newest" - zahodí vkládanou položku
+#   "block"       - put() čeká nejvýše block_timeout s, pak položku zahodí (None = čeká neomezeně)
+# Výjimka z handleru se zaloguje a započítá, vlákno běží dál.
+class SinkQueue:
+    def __init__(self, handler, maxsize=1000, policy="drop-oldest", block_timeout=None, name="jkbms-sink"):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"unknown backpressure policy: {policy}")
+        # Fronta bez místa by drop-oldest neměl co zahodit
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        self._thread.start()
+
+    # Vloží položku, vrací False pokud byla zahozena
+    def put(self, item):
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                if self.policy == "drop-oldest":
+                    self._items.popleft()
+                    self.dropped_oldest += 1
+                elif self.policy == "drop-newest":
+                    self.dropped_newest += 1
+                    return False
+                else:
+                    if not self._condition.wait_for(lambda: len(self._items) < self.maxsize or self._stopping,
+                                                    self.block_timeout) or self._stopping:
+                        self.dropped_newest += 1
+                        return False
+            self._items.append(item)
+            self.enqueued += 1
+            if len(self._items) > self.max_depth:
+                self.max_depth = len(self._items)
+            self._condition.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._items or self._stopping)
+                if not self._items:
+                    return
+                item = self._items.popleft()
+                self._busy = True
+                self._condition.notify_all()
+            try:
+                self.handler(item)
+            except Exception:
+                self.errors += 1
+                queue_log.exception("Sink handler failed")
+            with self._condition:
+                self._busy = False
+                self.processed += 1
+                self._condition.notify_all()
+
+    # Počká až se fronta vyprázdní, vrací False po timeoutu
+    def join(self, timeout=None):
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._items and not self._busy, timeout)
+
+    # Zastaví vlákno, drain=True nejdřív zpracuje zbytek fronty (nejvýše timeout s)
+    def stop(self, drain=True, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        if drain and self._thread.is_alive():
+            self.join(timeout)
+        with self._condition:
+            self._stopping = True
+            left = len(self._items)
+            self._items.clear()
+            self._condition.notify_all()
+        if left:
+            self.dropped_oldest += left
+            queue_log.warning("Dropped %d queued items on stop", left)
+        if self._thread.is_alive():
+            self._thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        return {
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped_oldest": self.dropped_oldest,
+            "dropped_newest": self.dropped_newest,
+            "errors": self.errors,
+        }
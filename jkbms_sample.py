@@ -0,0 +1,137 @@
+from array import array
+
+from jkbms_clock import receipt_time_ns
+from jkbms_decode import decode_frame
+
+# Dělitel z celočíselných jednotek vzorku na fyzikální jednotky výstupních polí
+# (mV -> V, 10 mA -> A, 0.1 °C -> °C), články voltage_cellN mají CELL_SCALE
+FIELD_SCALES = {
+    "voltage": 1000,
+    "current": 100,
+    "delta_voltage": 1000,
+    "soc": 1,
+    "power_tube_temp": 10,
+    "battery_box_temp": 10,
+    "battery_temp": 10,
+    "response_length": 1,
+}
+CELL_SCALE = 1000
+CELL_PREFIX = "voltage_cell"
+
+
+# Jeden dekódovaný cyklus BMS v celočíselných jednotkách
+# napětí v mV, proud v 10 mA (kladný = nabíjení), teploty v 0.1 °C, články array('H') v mV,
+# čas přijetí rámce v ns (int, přímo z jkbms_clock, bez převodu přes float)
+class BmsSample:
+    __slots__ = ("timestamp_ns", "voltage_mv", "current_10ma", "soc", "power_tube_temp_dc",
+                 "battery_box_temp_dc", "battery_temp_dc", "battery_warning", "battery_status",
+                 "cells", "response_length", "changed", "bms_id", "port")
+
+    def __init__(self, timestamp_ns=0, voltage_mv=0, current_10ma=0, soc=0, power_tube_temp_dc=0,
+                 battery_box_temp_dc=0, battery_temp_dc=0, battery_warning=0, battery_status=0,
+                 cells=None, response_length=0, changed=None, bms_id=None, port=None):
+        self.timestamp_ns = timestamp_ns
+        self.voltage_mv = voltage_mv
+        self.current_10ma = current_10ma
+        self.soc = soc
+        self.power_tube_temp_dc = power_tube_temp_dc
+        self.battery_box_temp_dc = battery_box_temp_dc
+        self.battery_temp_dc = battery_temp_dc
+        self.battery_warning = battery_warning
+        self.battery_status = battery_status
+        self.cells = cells if cells is not None else array('H')
+        self.response_length = response_length
+        # Množina polí změněných od minulého vzorku (IncrementalDecoder), None = neznámo
+        self.changed = changed
+        # BMS_ID jednotky (hex) při více BMS na jedné sběrnici, jinak None
+        self.bms_id = bms_id
+        # Sériový port, ze kterého vzorek přišel (flotila více adaptérů)
+        self.port = port
+
+    @classmethod
+    def from_frame(cls, response, timestamp_ns=None):
+        return cls.from_fields(decode_frame(response, raw=True), len(response), timestamp_ns)
+
+    # fields = výstup decode_frame(response, raw=True)
+    @classmethod
+    def from_fields(cls, fields, response_length=0, timestamp_ns=None, changed=None):
+        return cls(
+            timestamp_ns=receipt_time_ns() if timestamp_ns is None else timestamp_ns,
+            voltage_mv=fields.get("total_voltage", 0) * 10,
+            current_10ma=fields.get("current", 0),
+            soc=fields.get("soc", 0),
+            power_tube_temp_dc=fields.get("power_tube_temp", 0) * 10,
+            battery_box_temp_dc=fields.get("battery_box_temp", 0) * 10,
+            battery_temp_dc=fields.get("battery_temp", 0) * 10,
+            battery_warning=fields.get("battery_warning", 0),
+            battery_status=fields.get("battery_status", 0),
+            cells=fields.get("cell_voltages"),
+            response_length=response_length,
+            changed=changed,
+        )
+
+    # Hodnoty ve fyzikálních jednotkách pro výpisy a sinky
+    @property
+    def timestamp(self):
+        return self.timestamp_ns / 1e9
+
+    @property
+    def voltage(self):
+        return self.voltage_mv / 1000.0
+
+    @property
+    def current(self):
+        return self.current_10ma / 100.0
+
+    @property
+    def power_tube_temp(self):
+        return self.power_tube_temp_dc / 10.0
+
+    @property
+    def battery_box_temp(self):
+        return self.battery_box_temp_dc / 10.0
+
+    @property
+    def battery_temp(self):
+        return self.battery_temp_dc / 10.0
+
+    @property
+    def delta_voltage_mv(self):
+        if not self.cells:
+            return 0
+        return max(self.cells) - min(self.cells)
+
+    @property
+    def delta_voltage(self):
+        return self.delta_voltage_mv / 1000.0
+
+    # Výstupní pole v celočíselných jednotkách vzorku (mV, 10 mA, 0.1 °C), v pořadí payloadu
+    # Deadband porovnává tyto hodnoty, float ve V/A by hranici pásma lámal zaokrouhlením.
+    def raw_fields(self):
+        fields = {
+            "voltage": self.voltage_mv,
+            "current": self.current_10ma,
+            "delta_voltage": self.delta_voltage_mv,
+            "soc": self.soc,
+            "power_tube_temp": self.power_tube_temp_dc,
+            "battery_box_temp": self.battery_box_temp_dc,
+            "battery_temp": self.battery_temp_dc,
+        }
+        for cell, voltage_mv in enumerate(self.cells, 1):
+            fields[f"{CELL_PREFIX}{cell}"] = voltage_mv
+        fields["response_length"] = self.response_length
+        return fields
+
+    # Výstupní pole ve fyzikálních jednotkách v pořadí payloadu (line protocol, deadband)
+    def fields(self):
+        return {name: scale_field(name, value) for name, value in self.raw_fields().items()}
+
+    def __repr__(self):
+        return (f"BmsSample(voltage={self.voltage} V, current={self.current} A, soc={self.soc}%, "
+                f"cells={len(self.cells)})")
+
+
+# Hodnota pole z raw_fields() ve fyzikálních jednotkách
+def scale_field(name, value):
+    scale = CELL_SCALE if name.startswith(CELL_PREFIX) else FIELD_SCALES[name]
+    return value if scale == 1 else value / scale
@@ -0,0 +1,93 @@
+import math
+import time
+
+from jkbms_log import get_logger
+
+schedule_log = get_logger("schedule")
+
+
+# Plánovač s pevnou frekvencí na mřížce monotónních hodin
+# Cyklus k začíná v čase start + k * perioda, doba běhu úlohy se tedy do periody nepřičítá.
+# Při přetečení (úloha skončí po začátku dalšího slotu):
+#   "skip"     - zmeškané sloty se vynechají, pokračuje se dalším budoucím slotem
+#   "compress" - zmeškané sloty se spustí hned za sebou, nejvýše max_catchup najednou
+class FixedRateScheduler:
+    def __init__(self, rate_hz, overrun="skip", max_catchup=3, report_interval=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        if overrun not in ("skip", "compress"):
+            raise ValueError(f"unknown overrun policy: {overrun}")
+        self.period = 1.0 / rate_hz
+        self.overrun = overrun
+        self.max_catchup = max_catchup
+        self.report_interval = report_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_sum = 0.0
+        self.jitter_sq_sum = 0.0
+        self.jitter_max = 0.0
+        self.started = None
+
+    def _record(self, jitter):
+        self.cycles += 1
+        self.jitter_sum += jitter
+        self.jitter_sq_sum += jitter * jitter
+        if jitter > self.jitter_max:
+            self.jitter_max = jitter
+
+    # Spouští task() na mřížce, dokud should_stop() nevrátí True
+    def run(self, task, should_stop=lambda: False):
+        start = self.clock()
+        self.started = start
+        slot = 0
+        next_report = start + self.report_interval if self.report_interval else math.inf
+        while not should_stop():
+            deadline = start + slot * self.period
+            now = self.clock()
+            if deadline > now:
+                self.sleep(deadline - now)
+                now = self.clock()
+            self._record(now - deadline)
+            task()
+
+            slot += 1
+            finished = self.clock()
+            next_deadline = start + slot * self.period
+            if finished > next_deadline:
+                self.overruns += 1
+                behind = int((finished - next_deadline) / self.period) + 1
+                if self.overrun == "skip":
+                    slot += behind
+                    self.skipped += behind
+                elif behind > self.max_catchup:
+                    slot += behind - self.max_catchup
+                    self.skipped += behind - self.max_catchup
+
+            if finished >= next_report:
+                stats = self.stats()
+                schedule_log.info("Rate %.2f Hz (target %.2f Hz), jitter mean %.1f ms max %.1f ms, "
+                                  "overruns %d, skipped %d", stats["achieved_rate"], 1.0 / self.period,
+                                  stats["jitter_mean"] * 1000, stats["jitter_max"] * 1000,
+                                  stats["overruns"], stats["skipped"])
+                next_report = finished + self.report_interval
+
+    def stats(self):
+        elapsed = self.clock() - self.started if self.started is not None else 0.0
+        mean = self.jitter_sum / self.cycles if self.cycles else 0.0
+        variance = self.jitter_sq_sum / self.cycles - mean * mean if self.cycles else 0.0
+        return {
+            "cycles": self.cycles,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "achieved_rate": self.cycles / elapsed if elapsed > 0 else 0.0,
+            "jitter_mean": mean,
+            "jitter_stdev": math.sqrt(max(variance, 0.0)),
+            "jitter_max": self.jitter_max,
+        }
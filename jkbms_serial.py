@@ -0,0 +1,121 @@
+import time
+
+import serial
+
+from jkbms_clock import receipt_time_ns
+from jkbms_log import LazyHex, get_logger
+from jkbms_stream import FrameParser
+
+serial_log = get_logger("serial")
+
+
+# Přečte jeden platný rámec 0x4E57 přes proudový parser (STX, LENGTH, END_FLAG, součet)
+# Čte se jen tolik bajtů, kolik rámci chybí, šum a rozbité rámce parser přeskočí.
+# Při timeoutu vrací b"" a nedočtený rámec se započítá jako useknutý.
+def read_frame(s, timeout=0.5, parser=None):
+    parser = FrameParser() if parser is None else parser
+    deadline = time.monotonic() + timeout
+    while True:
+        frame = parser.next_frame()
+        if frame is not None:
+            return frame
+        if time.monotonic() >= deadline:
+            parser.flush()
+            return b""
+        chunk = s.read(parser.needed())
+        if chunk:
+            parser.feed(chunk)
+
+
+# Dlouhodobé sériové spojení s BMS
+# Port se otevře jednou a používá se pro všechny dotazy. Při chybě I/O se port zavře
+# a další pokus o otevření proběhne až po uplynutí backoff intervalu (exponenciálně roste).
+# transact() v takovém případě vrací None, takže démon běží dál.
+class BmsSerialSession:
+    def __init__(self, port, baud=115200, timeout=0.5, backoff_initial=0.5, backoff_max=30.0):
+        self.port = port
+        self.baud = baud
+        self.timeout = timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.serial = None
+        self.reconnects = 0
+        self.errors = 0
+        # Parser drží čítače poškozených / useknutých rámců přes všechny dotazy
+        self.parser = FrameParser()
+        # Čas přijetí poslední odpovědi v ns, jedna značka pro vzorek i deník
+        self.received_ns = 0
+        # Volitelně on_response(response, received_ns) pro každou přijatou odpověď (deník surových rámců)
+        self.on_response = None
+        self._backoff = backoff_initial
+        self._retry_at = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def is_open(self):
+        return self.serial is not None
+
+    def open(self):
+        if self.serial is not None:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        try:
+            s = serial.serial_for_url(self.port, self.baud, timeout=self.timeout, write_timeout=self.timeout)
+            s.reset_input_buffer()
+            s.reset_output_buffer()
+        except (serial.SerialException, OSError) as e:
+            self._schedule_retry(e)
+            return False
+        if self.errors:
+            self.reconnects += 1
+            serial_log.info("Reconnected to %s", self.port)
+        else:
+            serial_log.debug("Opened %s at %s baud", self.port, self.baud)
+        self.serial = s
+        self._backoff = self.backoff_initial
+        return True
+
+    def close(self):
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except (serial.SerialException, OSError):
+                pass
+            self.serial = None
+
+    def _schedule_retry(self, error):
+        self.errors += 1
+        self.close()
+        self._retry_at = time.monotonic() + self._backoff
+        serial_log.warning("Serial error on %s: %s (retry in %.1f s)", self.port, error, self._backoff)
+        self._backoff = min(self._backoff * 2, self.backoff_max)
+
+    # Pošle rámec a přečte platnou odpověď, při chybě vrací None, při timeoutu b""
+    def transact(self, request):
+        if not self.open():
+            return None
+        s = self.serial
+        try:
+            # Zbytky předchozí odpovědi by rozbily další rámec
+            s.reset_input_buffer()
+            self.parser.reset()
+            serial_log.debug("sending command: %s", LazyHex(request))
+            bytes_written = s.write(request)
+            serial_log.debug("wrote %s bytes", bytes_written)
+            response = read_frame(s, self.timeout, self.parser)
+        except (serial.SerialException, OSError) as e:
+            self._schedule_retry(e)
+            return None
+        serial_log.debug("Full response: %s", LazyHex(response))
+        if response:
+            self.received_ns = receipt_time_ns()
+            if self.on_response is not None:
+                self.on_response(response, self.received_ns)
+        return response
@@ -0,0 +1,232 @@
+import os
+import struct
+import threading
+import time
+
+from jkbms_log import get_logger
+
+spool_log = get_logger("spool")
+
+# Záznam v segmentu: délka payloadu (uint32 LE) + payload
+_RECORD = struct.Struct('<I')
+_SEGMENT_SUFFIX = ".spool"
+_CURSOR_FILE = "cursor"
+
+
+# Diskový spool pro výpadky výstupu (store-and-forward)
+# Payloady se zapisují jen na konec segmentových souborů (0000000001.spool, ...), zápisy jsou
+# sekvenční a bufferované, na disk se vynucují nejvýše jednou za sync_interval s a při přechodu
+# na nový segment - šetrné k SD kartě. Při překročení max_bytes se zahodí nejstarší segment.
+# Čtení: read_batch() vrátí záznamy od kurzoru, commit() posune kurzor a smaže dočtené segmenty.
+# Kurzor se ukládá do souboru "cursor", po restartu démona se pokračuje tam, kde se skončilo.
+class DiskSpool:
+    def __init__(self, directory, segment_bytes=1 << 20, max_bytes=64 << 20, sync_interval=5.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.segments = sorted(int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                               if name.endswith(_SEGMENT_SUFFIX))
+        self._cursor = self._load_cursor()
+        self._writer = None
+        self._writer_size = 0
+        self._synced_at = time.monotonic()
+        self.appended = 0
+        self.drained = 0
+        self.dropped_bytes = 0
+        self._repair_tail()
+        self.pending_bytes = sum(self._segment_size(segment) for segment in self.segments) - self._cursor[1]
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:010d}{_SEGMENT_SUFFIX}")
+
+    def _segment_size(self, segment):
+        try:
+            return os.path.getsize(self._path(segment))
+        except OSError:
+            return 0
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, _CURSOR_FILE)) as f:
+                segment, offset = (int(value) for value in f.read().split())
+        except (OSError, ValueError):
+            return (self.segments[0], 0) if self.segments else (1, 0)
+        if self.segments and segment < self.segments[0]:
+            return self.segments[0], 0
+        return segment, offset
+
+    # Useknutý poslední záznam (výpadek napájení při zápisu) se odřízne, jinak by na něm read_batch()
+    # stál bez posunu kurzoru a spool by se nikdy nevyprázdnil. Uzavřené segmenty jsou po fsync celé.
+    def _repair_tail(self):
+        if not self.segments:
+            return
+        segment = self.segments[-1]
+        path = self._path(segment)
+        offset = self._cursor[1] if self._cursor[0] == segment else 0
+        with open(path, "r+b") as f:
+            size = os.fstat(f.fileno()).st_size
+            f.seek(offset)
+            while True:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size or offset + _RECORD.size + _RECORD.unpack(header)[0] > size:
+                    break
+                offset += _RECORD.size + _RECORD.unpack(header)[0]
+                f.seek(offset)
+            if offset < size:
+                f.truncate(offset)
+                self.dropped_bytes += size - offset
+                spool_log.warning("Spool segment %d ends in a partial record, dropped %d bytes", segment, size - offset)
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, _CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}\n")
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        return self.pending_bytes
+
+    def _open_writer(self):
+        segment = self.segments[-1] + 1 if self.segments else self._cursor[0]
+        self.segments.append(segment)
+        self._writer = open(self._path(segment), "ab")
+        self._writer_size = 0
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._writer.close()
+            self._writer = None
+
+    # Zahodí nejstarší segmenty, dokud se spool nevejde do max_bytes (nejnovější data mají přednost)
+    def _enforce_limit(self):
+        while self.pending_bytes > self.max_bytes and len(self.segments) > 1:
+            segment = self.segments.pop(0)
+            size = self._segment_size(segment)
+            lost = size - self._cursor[1] if self._cursor[0] == segment else size
+            self.pending_bytes -= lost
+            self.dropped_bytes += lost
+            os.remove(self._path(segment))
+            self._cursor = (self.segments[0], 0)
+            spool_log.warning("Spool over %d bytes, dropped segment %d (%d bytes)", self.max_bytes, segment, lost)
+
+    def append(self, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self._lock:
+            if self._writer is None or self._writer_size >= self.segment_bytes:
+                self._close_writer()
+                self._open_writer()
+                self._enforce_limit()
+            self._writer.write(_RECORD.pack(len(payload)))
+            self._writer.write(payload)
+            size = _RECORD.size + len(payload)
+            self._writer_size += size
+            self.pending_bytes += size
+            self.appended += 1
+            now = time.monotonic()
+            if now - self._synced_at >= self.sync_interval:
+                self._writer.flush()
+                os.fsync(self._writer.fileno())
+                self._synced_at = now
+
+    # Nejvýše max_records záznamů od kurzoru, vrací (seznam payloadů, pozice pro commit)
+    def read_batch(self, max_records=100):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+            segment, offset = self._cursor
+            records = []
+            while len(records) < max_records and segment in self.segments:
+                with open(self._path(segment), "rb") as f:
+                    f.seek(offset)
+                    while len(records) < max_records:
+                        header = f.read(_RECORD.size)
+                        if len(header) < _RECORD.size:
+                            break
+                        payload = f.read(_RECORD.unpack(header)[0])
+                        if len(payload) < _RECORD.unpack(header)[0]:
+                            # Useknutý poslední záznam (výpadek napájení při zápisu)
+                            break
+                        records.append(payload)
+                        offset = f.tell()
+                if len(records) >= max_records or segment == self.segments[-1]:
+                    break
+                segment = self.segments[self.segments.index(segment) + 1]
+                offset = 0
+            return records, (segment, offset)
+
+    # Potvrdí odeslání záznamů do pozice z read_batch()
+    def commit(self, position, count):
+        with self._lock:
+            segment, offset = position
+            old_segment, old_offset = self._cursor
+            consumed = 0
+            while self.segments and self.segments[0] < segment:
+                done = self.segments.pop(0)
+                consumed += self._segment_size(done) - (old_offset if done == old_segment else 0)
+                os.remove(self._path(done))
+            consumed += offset - (old_offset if segment == old_segment else 0)
+            self.pending_bytes -= consumed
+            self._cursor = position
+            self.drained += count
+            self._save_cursor()
+
+    def close(self):
+        with self._lock:
+            self._close_writer()
+
+    def stats(self):
+        return {
+            "pending_bytes": self.pending_bytes,
+            "segments": len(self.segments),
+            "appended": self.appended,
+            "drained": self.drained,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+
+# Vyprazdňování spoolu na pozadí, když je výstup znovu dostupný
+# Každých interval s se odešle jedna dávka nejvýše batch_records záznamů jako jedna zpráva
+# (spojená separator) - živá data tak dostanou většinu kapacity. send(payload) vrací True při úspěchu,
+# jinak se dávka nepotvrdí a zkusí se znovu. available() = výstup je připojený.
+class SpoolDrainer(threading.Thread):
+    def __init__(self, spool, send, available, batch_records=100, interval=0.5, separator=b"\n"):
+        super().__init__(name="jkbms-spool", daemon=True)
+        self.spool = spool
+        self.send = send
+        self.available = available
+        self.batch_records = batch_records
+        self.interval = interval
+        self.separator = separator
+        self._stop_event = threading.Event()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        self.join(timeout)
+
+    def drain_once(self):
+        if not len(self.spool) or not self.available():
+            return 0
+        records, position = self.spool.read_batch(self.batch_records)
+        if not records:
+            # Jen useknutý konec starého segmentu, přeskočí se
+            self.spool.commit(position, 0)
+            return 0
+        if not self.send(self.separator.join(records)):
+            return 0
+        self.spool.commit(position, len(records))
+        if not len(self.spool):
+            spool_log.info("Spool drained (%d records total)", self.spool.drained)
+        return len(records)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.drain_once()
+            except OSError as e:
+                spool_log.warning("Spool drain failed: %s", e)
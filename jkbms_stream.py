@@ -0,0 +1,146 @@
+from jkbms_decode import FRAME_STX
+from jkbms_frames import checksum, frame_END_FLAG, tx_type_REPLY_FRAME
+from jkbms_log import get_logger
+
+stream_log = get_logger("stream")
+
+# Rozumné meze pole LENGTH, delší hodnota znamená šum místo hlavičky
+MIN_FRAME_LENGTH = 0x13
+MAX_FRAME_LENGTH = 0x400
+
+# Rámec končí END_FLAG(1) a CRC(4)
+_END_FLAG_OFFSET = -5
+# STX(2), LENGTH(2), BMS_ID(4), CMD, SOURCE, TX_TYPE
+_TX_TYPE_OFFSET = 10
+
+
+# Ověří rámec: STX, LENGTH, END_FLAG a 4bajtový kumulativní součet (horní 2 bajty 0)
+# tx_type: požadovaný směr (tx_type_REPLY_FRAME = jen odpověď BMS), None = libovolný
+def frame_is_valid(frame, tx_type=None):
+    if len(frame) < MIN_FRAME_LENGTH + 2 or frame[:2] != FRAME_STX:
+        return False
+    if ((frame[2] << 8) | frame[3]) + 2 != len(frame) or frame[_END_FLAG_OFFSET] != frame_END_FLAG:
+        return False
+    if tx_type is not None and frame[_TX_TYPE_OFFSET] != tx_type:
+        return False
+    return int.from_bytes(frame[-4:], 'big') == checksum(frame[:-4])
+
+
+# Proudový parser rámců 0x4E57 s resynchronizací
+# Data z portu se přidávají feed(), next_frame() vrací jen platné rámce. Buffer se čte od
+# posuvného začátku a přesouvá se až když je přečtená víc než polovina (kruhový buffer bez kopírování
+# při každém rámci). Po šumu nebo rozbitém rámci se hledá další STX hned za chybným začátkem,
+# takže falešné STX v šumu nespolkne skutečný rámec za ním.
+# tx_type: přijímají se jen rámce s tímto TX_TYPE, výchozí jsou odpovědi BMS. Vlastní dotaz vrácený
+# echem (half-duplex RS485 adaptéry s lokálním echem, loop://) se tak nevydává za odpověď. None = vše
+# (emulátor čte dotazy). Čítače: frames = platné rámce, corrupt = špatný LENGTH / END_FLAG / součet,
+# truncated = useknutý rámec při flush(), resyncs = kolikrát se zahazovaly bajty před STX,
+# echoes = platné rámce opačného směru, které se přeskočily
+class FrameParser:
+    def __init__(self, tx_type=tx_type_REPLY_FRAME):
+        self.tx_type = tx_type
+        self._buffer = bytearray()
+        self._start = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.corrupt = 0
+        self.truncated = 0
+        self.resyncs = 0
+        self.echoes = 0
+        self.discarded_bytes = 0
+
+    def __len__(self):
+        return len(self._buffer) - self._start
+
+    def __iter__(self):
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def feed(self, data):
+        if self._start and self._start * 2 >= len(self._buffer):
+            del self._buffer[:self._start]
+            self._start = 0
+        self._buffer += data
+
+    # Zahodí buffer bez započítání (např. před novým dotazem)
+    def reset(self):
+        self._buffer.clear()
+        self._start = 0
+
+    # Konec dat (timeout): nedočtený rámec se započítá jako useknutý a zahodí se
+    def flush(self):
+        if len(self):
+            if self._buffer.startswith(FRAME_STX, self._start):
+                self.truncated += 1
+                stream_log.warning("Truncated frame, %d bytes", len(self))
+            else:
+                self.discarded_bytes += len(self)
+        self.reset()
+
+    # Kolik bajtů ještě chybí do konce rozpracovaného rámce (alespoň 1)
+    def needed(self):
+        buffer = self._buffer
+        available = len(buffer) - self._start
+        if available < 4 or not buffer.startswith(FRAME_STX, self._start):
+            return max(1, 4 - available)
+        length = (buffer[self._start + 2] << 8) | buffer[self._start + 3]
+        return max(1, length + 2 - available)
+
+    def _skip(self, position):
+        skipped = position - self._start
+        if skipped:
+            self.resyncs += 1
+            self.discarded_bytes += skipped
+        self._start = position
+
+    # Další platný rámec z bufferu, nebo None pokud zatím žádný není celý
+    def next_frame(self):
+        buffer = self._buffer
+        while True:
+            position = buffer.find(FRAME_STX, self._start)
+            if position < 0:
+                # Poslední bajt může být první polovina STX
+                keep = 1 if len(buffer) > self._start and buffer[-1] == FRAME_STX[0] else 0
+                self._skip(len(buffer) - keep)
+                return None
+            self._skip(position)
+            if len(buffer) - position < 4:
+                return None
+            length = (buffer[position + 2] << 8) | buffer[position + 3]
+            if not MIN_FRAME_LENGTH <= length <= MAX_FRAME_LENGTH:
+                stream_log.warning("Invalid frame length %s", length)
+                self.corrupt += 1
+                self._start = position + 1
+                continue
+            end = position + length + 2
+            if len(buffer) < end:
+                return None
+            frame = bytes(buffer[position:end])
+            if not frame_is_valid(frame):
+                stream_log.warning("Corrupt frame, %d bytes, checksum %04x != %04x", len(frame),
+                                   int.from_bytes(frame[-4:], 'big'), checksum(frame[:-4]))
+                self.corrupt += 1
+                self._start = position + 1
+                continue
+            self._start = end
+            if self.tx_type is not None and frame[_TX_TYPE_OFFSET] != self.tx_type:
+                stream_log.debug("Skipping frame with TX_TYPE %02x (echo)", frame[_TX_TYPE_OFFSET])
+                self.echoes += 1
+                continue
+            self.frames += 1
+            return frame
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "corrupt": self.corrupt,
+            "truncated": self.truncated,
+            "resyncs": self.resyncs,
+            "echoes": self.echoes,
+            "discarded_bytes": self.discarded_bytes,
+        }
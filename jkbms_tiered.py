@@ -0,0 +1,123 @@
+import time
+from collections import namedtuple
+
+from jkbms_bus import BITS_PER_BYTE
+from jkbms_decode import REGISTERS, BmsFrameView, decode_frame
+from jkbms_frames import BROADCAST_BMS_ID, bms_id_bytes, command_READ, request_frame
+from jkbms_log import get_logger
+from jkbms_sample import BmsSample
+
+tiered_log = get_logger("tiered")
+
+# Třída rychlosti: název, perioda v s, registry čtené příkazem READ (0x03),
+# registers None = celý výpis READ_ALL_DATA (0x06)
+Tier = namedtuple("Tier", "name interval registers")
+
+# Napětí a proud fast_rate x za sekundu po jednotlivých registrech, SOC (mění se pomalu),
+# články, teploty a nastavení jednou za full_interval s v celém výpisu
+# READ (0x03) nese jedno ID registru, víc registrů v jednom dotazu protokol neumí. Výměna READ je
+# 21 + 23 B proti 21 + ~290 B celého výpisu (16 článků), dva rychlé registry na 10 Hz s výpisem
+# na 1 Hz tak dají ~2.6x méně bajtů na lince než celý výpis na 10 Hz (stats()["wire_saving"]).
+def default_tiers(fast_rate=10.0, full_interval=1.0, fast_registers=(0x83, 0x84)):
+    return (
+        Tier("fast", 1.0 / fast_rate, tuple(fast_registers)),
+        Tier("full", full_interval, None),
+    )
+
+
+DEFAULT_TIERS = default_tiers()
+
+
+# Plánovač s třídami rychlosti pro jednu BMS
+# Rychlá pole se čtou cíleně příkazem READ, zbytek v pomalejším celém výpisu.
+# Dekódovaná pole se slučují do jednoho stavu, ze kterého vzniká BmsSample.
+class TieredPoller:
+    def __init__(self, session, tiers=DEFAULT_TIERS, bms_id=BROADCAST_BMS_ID):
+        self.session = session
+        self.tiers = tuple(tiers)
+        bms_id = bms_id_bytes(bms_id)
+        # (požadavek, název čteného pole), None = celý výpis
+        self.requests = {}
+        for tier in self.tiers:
+            if tier.registers is None:
+                self.requests[tier.name] = ((request_frame(bms_id=bms_id), None),)
+            else:
+                self.requests[tier.name] = tuple((request_frame(command_READ, bms_id, register),
+                                                  REGISTERS[register].name) for register in tier.registers)
+        self.fields = {}
+        self.response_length = 0
+        self._next_due = {tier.name: 0.0 for tier in self.tiers}
+        self.bytes_on_wire = 0
+        # Velikost poslední výměny celého výpisu a počet kol, pro srovnání s dotazováním jen výpisem
+        self.full_exchange_bytes = 0
+        self.rounds = 0
+        self.timeouts = 0
+        self.started = time.monotonic()
+
+    def _read_tier(self, tier):
+        changed = set()
+        for request, field in self.requests[tier.name]:
+            response = self.session.transact(request)
+            self.bytes_on_wire += len(request) + len(response or b"")
+            if not response:
+                self.timeouts += 1
+                continue
+            if field is None:
+                self.response_length = len(response)
+                self.full_exchange_bytes = len(request) + len(response)
+                decoded = decode_frame(response, raw=True).items()
+            else:
+                # Rychlé kolo potřebuje jen čtený registr, líný pohled nedekóduje nic dalšího
+                value = BmsFrameView(response, raw=True).get(field)
+                decoded = () if value is None else ((field, value),)
+            for name, value in decoded:
+                if self.fields.get(name) != value:
+                    self.fields[name] = value
+                    changed.add(name)
+        return changed
+
+    # Provede všechny třídy, které jsou na řadě, vrací (BmsSample, změněná pole) nebo None
+    def poll_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        changed = set()
+        polled = False
+        for tier in self.tiers:
+            if now >= self._next_due[tier.name]:
+                # Mřížka podle periody, po zpoždění se zmeškaná kola nedohánějí
+                due = self._next_due[tier.name] + tier.interval
+                self._next_due[tier.name] = due if due > now else now + tier.interval
+                changed |= self._read_tier(tier)
+                polled = True
+        if not polled:
+            return None
+        self.rounds += 1
+        if not self.fields:
+            return None
+        # Čas přijetí poslední odpovědi kola
+        sample = BmsSample.from_fields(self.fields, self.response_length, self.session.received_ns, changed)
+        return sample, changed
+
+    def next_due(self):
+        return min(self._next_due.values())
+
+    # Smyčka: čeká na nejbližší třídu a předá vzorek callbacku
+    def run(self, on_sample, should_stop=lambda: False):
+        while not should_stop():
+            delay = self.next_due() - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            result = self.poll_due()
+            if result is not None:
+                on_sample(result[0])
+
+    # wire_saving = kolikrát víc bajtů by stálo stejný počet kol jen celým výpisem
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        full_only = self.rounds * self.full_exchange_bytes
+        return {
+            "rounds": self.rounds,
+            "bytes_per_second": self.bytes_on_wire / elapsed,
+            "wire_utilization": self.bytes_on_wire * BITS_PER_BYTE / getattr(self.session, "baud", 115200) / elapsed,
+            "wire_saving": full_only / self.bytes_on_wire if self.bytes_on_wire else 0.0,
+            "timeouts": self.timeouts,
+        }
@@ -1,5 +1,6 @@
 import serial
-import time
+
+from jkbms_serial import read_frame
 
 # Funkce pro výpočet kontrolního součtu (CRC)
 def crc(byteData):
@@ -11,20 +12,9 @@ def crc(byteData):
     print(f"CRC: {crc_byte3:02x} {crc_byte4:02x}")
     return [crc_byte3, crc_byte4]
 
-# Funkce pro čtení celé odpovědi
+# Funkce pro čtení celé odpovědi - délku rámce bere z pole LENGTH
 def read_full_response(serial_port):
-    response = bytearray()
-    start_time = time.time()
-    serial_port.timeout = 0.5  # Nastavíme kratší timeout pro čtení
-    while True:
-        data = serial_port.read(212)  # Čteme až 1024 bajtů najednou
-        response.extend(data)
-        if len(data) < 212:
-            # Pokud jsme přečetli méně než 1024 bajtů, pravděpodobně už žádná data nejsou
-            break
-        # Přidáme kontrolu, aby smyčka neskončila nekonečně
-        if time.time() - start_time > 2:
-            break
+    response = read_frame(serial_port, timeout=2)
     print(f"Got response: {response.hex()}")
     return response
 